@@ -0,0 +1,69 @@
+import io
+from sheet import load_sheet, load_sheets, is_path
+from schema import TypeInfo, OBJECT, build_struct, package_structs, render_structs
+import xls2json
+import xls2lua
+import xls2struct
+
+# 在进程内调用导出工具, 不需要启动子进程, 也不需要先把输入写到磁盘:
+#   sh = export_sheet(data)           # 路径, bytes 或二进制文件对象 -> sheet.Sheet
+#   sheets = export_sheets(data, '*') # 一次读取工作簿里的多个 sheet
+#   emit_json(sh, stream)             # 写到任意文本流
+#   root = sheet_struct(sh)           # 表格对应的 go 结构体 -> schema.GoStruct
+#   root = infer_structs(obj, 'Name') # json 解码后的对象 -> schema.GoStruct
+#   source = render_go([root, ...])   # 生成 go 代码
+# 常驻进程可以一直持有模块和 sheetcache.SheetCache, 每次调用只处理变化的输入
+
+
+def export_sheet(source, cache=None):
+    """读取工作簿的第一个 sheet 并检查表头声明; cache 只对路径有效"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return load_sheet(source, cache if is_path(source) else None)
+
+
+def export_sheets(source, sheets='*', cache=None):
+    """读取工作簿里的多个 sheet, sheets 的写法见 sheet.select_sheets"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return load_sheets(source, cache if is_path(source) else None, sheets)
+
+
+def emit_json(sh, stream, intern=False):
+    """与 xls2json(intern 时为 --intern)生成的文件内容相同; 没有表头时不写, 返回 False"""
+    title = sh.title(2)
+    if len(title) == 0 or len(str(title[0]).strip()) == 0:
+        return False
+    if intern:
+        xls2json.writeInterned(sh, stream)
+    else:
+        xls2json.writeSheet(sh, stream)
+    return True
+
+
+def emit_lua(sh, stream, intern=False):
+    """与 xls2lua(intern 时为 --intern)生成的文件内容相同; 没有表头时不写, 返回 False"""
+    title = sh.title(1)
+    if len(title) == 0 or len(str(title[0]).strip()) == 0:
+        return False
+    xls2lua.writeSheet(sh, stream, intern)
+    return True
+
+
+def sheet_struct(sh):
+    """与 xls2struct 一样由表格推断 <Sheet>Data 结构体, 没有表头时返回 None"""
+    return xls2struct.emitSheet(sh)
+
+
+def infer_structs(obj, name):
+    """由 json 解码后的对象推断结构体, 顶层是数组时合并所有元素; 顶层不是对象时返回 None"""
+    info = TypeInfo().add_all(obj if isinstance(obj, list) else [obj])
+    if info.kinds != OBJECT:
+        return None
+    return build_struct(info, name)
+
+
+def render_go(roots, package='xls', omit_empty=False):
+    """把多个顶层结构体放进一个 go 包, 返回 go 源码; 相同结构只生成一次"""
+    structs = package_structs([r for r in roots if r is not None])
+    return f"package {package}\n\n" + ''.join(s + "\n\n" for s in render_structs(structs, omit_empty))
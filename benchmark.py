@@ -0,0 +1,392 @@
+from pathlib import Path
+from xml.sax.saxutils import escape
+import getopt
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import zipfile
+from queue import Empty
+
+# 性能基准: 生成合成的工作簿和 json 语料, 分别测量四个工具的总耗时, 各阶段耗时和峰值内存
+# 结果保存成 json, 方便在不同提交之间对比
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.ms-excel.sheet.macroEnabled.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+</Types>'''
+
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="%s" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>
+</Relationships>'''
+
+
+def col_name(n):
+    """0 -> 'A', 27 -> 'AB'"""
+    name = ''
+    n += 1
+    while n:
+        n, r = divmod(n - 1, 26)
+        name = chr(65 + r) + name
+    return name
+
+
+def write_workbook(path, sheet_name, rows):
+    """写一个只有一个 sheet 的最小 xlsm, 字符串放进共享字符串表"""
+    strings = {}
+    lines = []
+    for r, row in enumerate(rows):
+        cells = []
+        for c, value in enumerate(row):
+            ref = f'{col_name(c)}{r + 1}'
+            if isinstance(value, str):
+                index = strings.setdefault(value, len(strings))
+                cells.append(f'<c r="{ref}" t="s"><v>{index}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}"><v>{value!r}</v></c>')
+        lines.append(f'<row r="{r + 1}">{"".join(cells)}</row>')
+    ncols = max(len(row) for row in rows)
+    sheet = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+             '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+             f'<dimension ref="A1:{col_name(ncols - 1)}{len(rows)}"/><sheetData>'
+             + ''.join(lines) + '</sheetData></worksheet>')
+    sst = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+           f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="{len(strings)}" uniqueCount="{len(strings)}">'
+           + ''.join(f'<si><t xml:space="preserve">{escape(s)}</t></si>' for s in strings) + '</sst>')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES)
+        zf.writestr('_rels/.rels', ROOT_RELS)
+        zf.writestr('xl/workbook.xml', WORKBOOK % escape(sheet_name))
+        zf.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        zf.writestr('xl/worksheets/sheet1.xml', sheet)
+        zf.writestr('xl/sharedStrings.xml', sst)
+
+
+def random_cell(rng, kind):
+    if kind == 0:
+        return rng.randint(0, 100000)
+    if kind == 1:
+        return round(rng.uniform(0, 1000), 3)
+    if kind == 2:
+        return 'item_%d' % rng.randint(0, 500)
+    if kind == 3:
+        return '{%s}' % ','.join('{%d,%d}' % (rng.randint(1, 999), rng.randint(1, 99)) for _ in range(rng.randint(1, 3)))
+    return '[%s]' % ','.join(str(rng.randint(0, 99)) for _ in range(rng.randint(1, 4)))
+
+
+def make_workbooks(root_dir, workbooks=10, rows=1000, cols=10, seed=0):
+    """N 个工作簿 x M 行 x K 列, 数字/小数/字符串/{...}/[...] 五种单元格轮流出现"""
+    rng = random.Random(seed)
+    os.makedirs(root_dir, exist_ok=True)
+    for n in range(workbooks):
+        name = f'Bench{n}'
+        keys = ['id'] + [f'field{c}' for c in range(1, cols)]
+        data = [['注释'] * cols, keys, keys]
+        for r in range(rows):
+            data.append([r + 1] + [random_cell(rng, c % 5) for c in range(1, cols)])
+        write_workbook(os.path.join(root_dir, name + '.xlsm'), name, data)
+
+
+def random_value(rng, depth, width, length):
+    kind = rng.randrange(6) if depth > 0 else rng.randrange(4)
+    if kind == 0:
+        return rng.randint(0, 100000)
+    if kind == 1:
+        return rng.uniform(0, 1000)
+    if kind == 2:
+        return 'text_%d' % rng.randint(0, 1000)
+    if kind == 3:
+        return rng.random() < 0.5
+    if kind == 4:
+        return random_object(rng, depth - 1, width, length)
+    return [random_object(rng, depth - 1, width, length) for _ in range(rng.randint(0, length))]
+
+
+def random_object(rng, depth, width, length):
+    # 同一位置的字段名固定, 这样各条记录的结构可以合并
+    return {f'f{depth}_{w}': random_value(rng, depth, width, length) for w in range(width)}
+
+
+def make_json(root_dir, files=5, records=1000, depth=3, width=5, length=3, seed=0):
+    """每个文件是一个 records 条记录的数组, 记录嵌套 depth 层, 每层 width 个字段, 数组长度不超过 length"""
+    rng = random.Random(seed)
+    os.makedirs(root_dir, exist_ok=True)
+    for n in range(files):
+        with open(os.path.join(root_dir, f'Bench{n}.json'), 'w') as f:
+            json.dump([random_object(rng, depth, width, length) for _ in range(records)], f)
+
+
+def timed(phases, name, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+    return result
+
+
+def bench_xls2json(root_dir, store_dir):
+    import xls2json
+    from sheet import load_sheet
+    phases = {}
+    for json_file in sorted(Path(root_dir).glob('**/*.xlsm')):
+        sh = timed(phases, 'read', load_sheet, json_file)
+        title = sh.title(2)
+        timed(phases, 'parse', lambda: [xls2json.parseRow(title, row) for row in sh.rows])
+        timed(phases, 'emit', xls2json.emitSheet, sh, store_dir)
+    return phases
+
+
+def bench_xls2lua(root_dir, store_dir):
+    import xls2lua
+    from sheet import load_sheet
+    phases = {}
+    for json_file in sorted(Path(root_dir).glob('**/*.xlsm')):
+        sh = timed(phases, 'read', load_sheet, json_file)
+        timed(phases, 'emit', xls2lua.emitSheet, sh, store_dir)
+    return phases
+
+
+def bench_xls2struct(root_dir, store_dir):
+    import xls2struct
+    from sheet import load_sheet
+    phases = {}
+    roots = []
+    for json_file in sorted(Path(root_dir).glob('**/*.xlsm')):
+        sh = timed(phases, 'read', load_sheet, json_file)
+        roots.append(timed(phases, 'infer', xls2struct.emitSheet, sh))
+    timed(phases, 'emit', xls2struct.writeStructs, store_dir, roots)
+    return phases
+
+
+def bench_json2struct(root_dir, store_dir):
+    import json2struct
+    from schema import TypeInfo, build_struct, create_package_strings
+    phases = {}
+    roots = []
+    for json_file in sorted(Path(root_dir).glob('**/*.json')):
+        with open(json_file, 'r') as f:
+            text = timed(phases, 'read', f.read)
+        data = timed(phases, 'parse', json.loads, text)
+        info = timed(phases, 'infer', TypeInfo().add_all, data if isinstance(data, list) else [data])
+        roots.append(timed(phases, 'emit', build_struct, info, json_file.stem))
+
+    def emit():
+        json2struct.write_struct_file(create_package_strings(roots, False), json2struct.package_name,
+                                      f'{store_dir}/{json2struct.package_name}.go')
+    timed(phases, 'emit', emit)
+    return phases
+
+
+go_bench_re = re.compile(r'^Benchmark(\S+?)(?:-\d+)?\s+(\d+)\s+([\d.]+) ns/op(?:\s+([\d.]+) MB/s)?'
+                         r'(?:\s+(\d+) B/op\s+(\d+) allocs/op)?')
+
+
+def go_benchmark(json_dir, work_dir):
+    """json2struct --codec 生成的解码器与 encoding/json 反射解码对比, 需要安装 go"""
+    go = shutil.which('go')
+    if go is None:
+        return {'skipped': '没有找到 go'}
+    import json2struct
+    from gocodec import create_benchmark_strings
+    from schema import package_structs
+    bench_dir = os.path.join(work_dir, 'gobench')
+    for name, codec in (('plain', False), ('fast', True)):
+        os.makedirs(os.path.join(bench_dir, name), exist_ok=True)
+        json2struct.parseJson(json_dir, os.path.join(bench_dir, name), codec=codec)
+    # 与 parseJson 一样确定结构体名字, 只测顶层是数组的文件
+    pairs = [(json2struct.parseFile(f), f) for f in sorted(Path(json_dir).glob('**/*.json'))]
+    pairs = [(root, f) for root, f in pairs if root is not None]
+    package_structs([root for root, f in pairs])
+    with open(os.path.join(bench_dir, 'go.mod'), 'w') as f:
+        f.write('module gobench\n\ngo 1.18\n')
+    with open(os.path.join(bench_dir, 'bench_test.go'), 'w', encoding='utf-8') as f:
+        f.write(create_benchmark_strings('gobench', [root for root, p in pairs], [os.path.abspath(p) for r, p in pairs]))
+    proc = subprocess.run([go, 'test', '-run', '.', '-bench', '.'], cwd=bench_dir, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT)
+    output = proc.stdout.decode('utf-8', 'replace')
+    if proc.returncode != 0:
+        return {'failed': output}
+    results = {}
+    for line in output.splitlines():
+        m = go_bench_re.match(line)
+        if m:
+            name, n, ns, mbs, b, allocs = m.groups()
+            results[name] = {'ns_op': float(ns), 'mb_s': float(mbs) if mbs else None,
+                             'allocs_op': int(allocs) if allocs else None}
+    return results
+
+
+# 工具名 -> (使用的语料, 分阶段计时函数)
+TOOLS = {
+    'xls2json': ('xls', bench_xls2json),
+    'xls2lua': ('xls', bench_xls2lua),
+    'xls2struct': ('xls', bench_xls2struct),
+    'json2struct': ('json', bench_json2struct),
+}
+
+
+def run_case(tool, root_dir, store_dir, queue):
+    """在独立的进程里运行, 峰值内存只包含这个工具自己; 出错时返回 {'failed': 错误信息}"""
+    try:
+        corpus, phase_func = TOOLS[tool]
+        module = __import__(tool)
+        start = time.perf_counter()
+        module.parseJson(root_dir, store_dir)
+        total = time.perf_counter() - start
+        # 峰值内存在分阶段重跑之前读取, 只反映完整运行一次
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            rss //= 1024  # macOS 的单位是字节
+        phases = phase_func(root_dir, store_dir)
+    except Exception:
+        queue.put({'failed': traceback.format_exc()})
+        return
+    queue.put({'total': total, 'phases': phases, 'peak_rss_kb': rss})
+
+
+def measure(tool, root_dir, store_dir, poll=1.0):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    p = ctx.Process(target=run_case, args=(tool, root_dir, store_dir, queue))
+    p.start()
+    # 先取结果再 join, 结果较大时子进程要等队列被读走才能退出; 子进程没有留下结果就退出时不再等待
+    while True:
+        try:
+            result = queue.get(timeout=poll)
+            break
+        except Empty:
+            if not p.is_alive():
+                try:
+                    result = queue.get(timeout=poll)
+                except Empty:
+                    result = {'failed': '测量进程异常退出, exitcode %s' % p.exitcode}
+                break
+    p.join()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(params, tools=None, repeat=1, work_dir=None):
+    tools = tools or list(TOOLS)
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='json2struct-bench-')
+    try:
+        xls_dir = os.path.join(work_dir, 'xls')
+        json_dir = os.path.join(work_dir, 'json')
+        start = time.perf_counter()
+        make_workbooks(xls_dir, params['workbooks'], params['rows'], params['cols'], params['seed'])
+        make_json(json_dir, params['json_files'], params['records'], params['depth'], params['width'],
+                  params['length'], params['seed'])
+        results = {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'params': params,
+            'corpus_seconds': time.perf_counter() - start,
+            'tools': {},
+        }
+        for tool in tools:
+            if tool == 'gocodec':
+                results['tools'][tool] = go_benchmark(json_dir, work_dir)
+                continue
+            corpus = TOOLS[tool][0]
+            runs = []
+            for _ in range(repeat):
+                store_dir = os.path.join(work_dir, 'out', tool)
+                os.makedirs(store_dir, exist_ok=True)
+                runs.append(measure(tool, xls_dir if corpus == 'xls' else json_dir, store_dir))
+                if 'failed' in runs[-1]:
+                    break
+            # 多次运行取总耗时最短的一次, 失败时记录错误信息
+            failed = [r for r in runs if 'failed' in r]
+            results['tools'][tool] = failed[0] if failed else min(runs, key=lambda r: r['total'])
+        return results
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv):
+    usage = ('benchmark.py [-o <result.json>] [--tools a,b] [--repeat R] [--seed S]'
+             ' [--workbooks N] [--rows M] [--cols K]'
+             ' [--json-files N] [--records R] [--depth D] [--width W] [--length L]')
+    params = {
+        'workbooks': 10, 'rows': 1000, 'cols': 10,
+        'json_files': 5, 'records': 1000, 'depth': 3, 'width': 5, 'length': 3,
+        'seed': 0,
+    }
+    outputfile = ''
+    tools = None
+    repeat = 1
+    try:
+        opts, args = getopt.getopt(argv, "ho:", ["ofile=", "tools=", "repeat=", "seed=", "workbooks=", "rows=",
+                                                 "cols=", "json-files=", "records=", "depth=", "width=", "length="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(usage)
+            sys.exit()
+        elif opt in ("-o", "--ofile"):
+            outputfile = arg
+        elif opt == "--tools":
+            tools = arg.split(',')
+        elif opt == "--repeat":
+            repeat = int(arg)
+        else:
+            params[opt[2:].replace('-', '_')] = int(arg)
+
+    results = run(params, tools, repeat)
+    for tool, r in results['tools'].items():
+        if tool == 'gocodec':
+            for name, b in r.items():
+                if isinstance(b, dict):
+                    print(f"{tool:12s} {name:32s} {b['ns_op'] / 1e6:.3f}ms/op  {b['mb_s']}MB/s  {b['allocs_op']} allocs/op")
+                else:
+                    print(f'{tool:12s} {name}: {b}')
+            continue
+        if 'failed' in r:
+            print(f'{tool:12s} 失败:\n{r["failed"]}')
+            continue
+        phases = ', '.join(f'{k} {v:.3f}s' for k, v in r['phases'].items())
+        print(f"{tool:12s} {r['total']:.3f}s  peak {r['peak_rss_kb'] // 1024}MB  ({phases})")
+    if outputfile:
+        with open(outputfile, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print('结果已保存到:', outputfile)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,54 @@
+import marshal
+import os
+from output import write_file
+
+# --diff: 每次导出时在生成的文件旁边保存各行的快照(id -> 字段 -> 导出的值的文本),
+# 下一次导出时与它比较, 写出只含变化的补丁; 运行中的服务器应用补丁即可, 不需要重新加载整张表
+
+MAGIC = b'XLSD'
+
+
+def snapshot_path(output):
+    """快照是 output 旁边的隐藏文件"""
+    head, tail = os.path.split(output)
+    return os.path.join(head, '.' + tail + '.rows')
+
+
+def load_snapshot(path):
+    """返回 {id: {字段: 值的文本}}, 没有快照或快照损坏时返回 None"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if data[:4] != MAGIC:
+        return None
+    try:
+        return marshal.loads(data[4:])
+    except (ValueError, EOFError, TypeError):
+        return None
+
+
+def save_snapshot(path, rows):
+    write_file(path, MAGIC + marshal.dumps(rows))
+
+
+def diff_rows(old, new):
+    """
+    返回 (removed, added, changed, cleared): 删掉的 id, 新增的行, 变化的行里新的字段值, 变化的行里清空的字段.
+    变化的行都在 changed 里(只清空了字段时为空), 都按表里的顺序排列
+    """
+    removed = [id for id in old if id not in new]
+    added = {}
+    changed = {}
+    cleared = {}
+    for id, row in new.items():
+        prev = old.get(id)
+        if prev is None:
+            added[id] = row
+        elif prev != row:
+            changed[id] = {key: value for key, value in row.items() if prev.get(key) != value}
+            gone = [key for key in prev if key not in row]
+            if gone:
+                cleared[id] = gone
+    return removed, added, changed, cleared
@@ -0,0 +1,781 @@
+import json
+
+# 为生成的结构体生成不经过反射的 UnmarshalJSON/MarshalJSON (类似 easyjson)
+# 解码用一个按字节扫描的 token 扫描器, 编码直接拼接字节, 输出与 encoding/json 一致
+# 只有 interface{} 字段里出现 map/slice/基本类型以外的值时才会退回 encoding/json
+
+GO_RUNTIME = '''import (
+	stdjson "encoding/json"
+	"errors"
+	"math"
+	"sort"
+	"strconv"
+	"unicode/utf16"
+	"unicode/utf8"
+)
+
+// jsonScanner 逐字节扫描 json, key 只按字段标签精确匹配(导出工具生成的数据总是如此)
+type jsonScanner struct {
+	data []byte
+	pos  int
+	key  []byte
+	err  error
+}
+
+func (s *jsonScanner) fail(msg string) {
+	if s.err == nil {
+		s.err = errors.New("json: " + msg + " at offset " + strconv.Itoa(s.pos))
+	}
+	s.pos = len(s.data) // 出错后后面的调用都直接结束
+}
+
+func (s *jsonScanner) ws() byte {
+	for s.pos < len(s.data) {
+		c := s.data[s.pos]
+		if c != ' ' && c != '\\t' && c != '\\n' && c != '\\r' {
+			return c
+		}
+		s.pos++
+	}
+	return 0
+}
+
+func (s *jsonScanner) literal(word string) bool {
+	if len(s.data)-s.pos >= len(word) && string(s.data[s.pos:s.pos+len(word)]) == word {
+		s.pos += len(word)
+		return true
+	}
+	s.fail("invalid literal")
+	return false
+}
+
+// null 读到 null 时返回 true
+func (s *jsonScanner) null() bool {
+	return s.ws() == 'n' && s.literal("null")
+}
+
+// objectStart 读到 '{' 返回 true, null 返回 false
+func (s *jsonScanner) objectStart() bool {
+	if s.null() {
+		return false
+	}
+	if s.ws() != '{' {
+		s.fail("expected object")
+		return false
+	}
+	s.pos++
+	return true
+}
+
+// objectNext 读下一个 key 到 s.key, 对象结束时返回 false; i 是已经读过的字段数
+func (s *jsonScanner) objectNext(i int) bool {
+	c := s.ws()
+	if c == '}' {
+		s.pos++
+		return false
+	}
+	if i > 0 {
+		if c != ',' {
+			s.fail("expected , or }")
+			return false
+		}
+		s.pos++
+		c = s.ws()
+	}
+	if c != '"' {
+		s.fail("expected key")
+		return false
+	}
+	s.key = s.stringBytes()
+	if s.ws() != ':' {
+		s.fail("expected :")
+		return false
+	}
+	s.pos++
+	return s.err == nil
+}
+
+// arrayStart 读到 '[' 返回 true, null 返回 false
+func (s *jsonScanner) arrayStart() bool {
+	if s.null() {
+		return false
+	}
+	if s.ws() != '[' {
+		s.fail("expected array")
+		return false
+	}
+	s.pos++
+	return true
+}
+
+func (s *jsonScanner) arrayNext(i int) bool {
+	c := s.ws()
+	if c == ']' {
+		s.pos++
+		return false
+	}
+	if i > 0 {
+		if c != ',' {
+			s.fail("expected , or ]")
+			return false
+		}
+		s.pos++
+	}
+	return s.err == nil
+}
+
+// stringBytes 没有转义时直接返回输入的切片, 不分配内存
+func (s *jsonScanner) stringBytes() []byte {
+	if s.ws() != '"' {
+		s.fail("expected string")
+		return nil
+	}
+	s.pos++
+	start := s.pos
+	for s.pos < len(s.data) {
+		c := s.data[s.pos]
+		if c == '"' {
+			b := s.data[start:s.pos]
+			s.pos++
+			return b
+		}
+		if c == '\\\\' {
+			return s.unescape(append([]byte(nil), s.data[start:s.pos]...))
+		}
+		if c < 0x20 {
+			s.fail("control character in string")
+			return nil
+		}
+		s.pos++
+	}
+	s.fail("unexpected end of string")
+	return nil
+}
+
+func (s *jsonScanner) hex4() rune {
+	if len(s.data)-s.pos < 4 {
+		s.fail("invalid escape")
+		return -1
+	}
+	var r rune
+	for _, c := range s.data[s.pos : s.pos+4] {
+		switch {
+		case '0' <= c && c <= '9':
+			c -= '0'
+		case 'a' <= c && c <= 'f':
+			c -= 'a' - 10
+		case 'A' <= c && c <= 'F':
+			c -= 'A' - 10
+		default:
+			s.fail("invalid escape")
+			return -1
+		}
+		r = r*16 + rune(c)
+	}
+	s.pos += 4
+	return r
+}
+
+func (s *jsonScanner) unescape(buf []byte) []byte {
+	for s.pos < len(s.data) {
+		c := s.data[s.pos]
+		if c == '"' {
+			s.pos++
+			return buf
+		}
+		if c < 0x20 {
+			s.fail("control character in string")
+			return nil
+		}
+		if c != '\\\\' {
+			buf = append(buf, c)
+			s.pos++
+			continue
+		}
+		if s.pos+1 >= len(s.data) {
+			break
+		}
+		e := s.data[s.pos+1]
+		s.pos += 2
+		switch e {
+		case '"', '\\\\', '/':
+			buf = append(buf, e)
+		case 'b':
+			buf = append(buf, '\\b')
+		case 'f':
+			buf = append(buf, '\\f')
+		case 'n':
+			buf = append(buf, '\\n')
+		case 'r':
+			buf = append(buf, '\\r')
+		case 't':
+			buf = append(buf, '\\t')
+		case 'u':
+			r := s.hex4()
+			if r < 0 {
+				return nil
+			}
+			if utf16.IsSurrogate(r) {
+				r2 := rune(-1)
+				if len(s.data)-s.pos >= 6 && s.data[s.pos] == '\\\\' && s.data[s.pos+1] == 'u' {
+					save := s.pos
+					s.pos += 2
+					if r2 = utf16.DecodeRune(r, s.hex4()); r2 == utf8.RuneError {
+						s.pos = save
+					}
+				}
+				if r2 < 0 || r2 == utf8.RuneError {
+					r2 = utf8.RuneError
+				}
+				r = r2
+			}
+			buf = utf8.AppendRune(buf, r)
+		default:
+			s.fail("invalid escape")
+			return nil
+		}
+	}
+	s.fail("unexpected end of string")
+	return nil
+}
+
+// number 返回数字的原始文本
+func (s *jsonScanner) number() []byte {
+	s.ws()
+	start := s.pos
+	for s.pos < len(s.data) {
+		c := s.data[s.pos]
+		if ('0' <= c && c <= '9') || c == '-' || c == '+' || c == '.' || c == 'e' || c == 'E' {
+			s.pos++
+		} else {
+			break
+		}
+	}
+	if start == s.pos {
+		s.fail("expected number")
+	}
+	return s.data[start:s.pos]
+}
+
+// 下面的 read 方法遇到 null 时与 encoding/json 一样保留原值
+
+func (s *jsonScanner) readInt(p *int) {
+	if s.null() {
+		return
+	}
+	b := s.number()
+	if s.err != nil {
+		return
+	}
+	neg := b[0] == '-'
+	if neg {
+		b = b[1:]
+	}
+	if len(b) == 0 {
+		s.fail("invalid number")
+		return
+	}
+	n := 0
+	for _, c := range b {
+		if c < '0' || c > '9' {
+			s.fail("expected integer")
+			return
+		}
+		if n > (math.MaxInt-int(c-'0'))/10 {
+			s.fail("integer overflow")
+			return
+		}
+		n = n*10 + int(c-'0')
+	}
+	if neg {
+		n = -n
+	}
+	*p = n
+}
+
+func (s *jsonScanner) float(bits int) (float64, bool) {
+	if s.null() {
+		return 0, false
+	}
+	b := s.number()
+	if s.err != nil {
+		return 0, false
+	}
+	f, err := strconv.ParseFloat(string(b), bits)
+	if err != nil {
+		s.fail("invalid number")
+		return 0, false
+	}
+	return f, true
+}
+
+func (s *jsonScanner) readFloat32(p *float32) {
+	if f, ok := s.float(32); ok {
+		*p = float32(f)
+	}
+}
+
+func (s *jsonScanner) readFloat64(p *float64) {
+	if f, ok := s.float(64); ok {
+		*p = f
+	}
+}
+
+func (s *jsonScanner) readString(p *string) {
+	if s.null() {
+		return
+	}
+	if b := s.stringBytes(); s.err == nil {
+		*p = string(b)
+	}
+}
+
+func (s *jsonScanner) readBool(p *bool) {
+	switch s.ws() {
+	case 'n':
+		s.literal("null")
+	case 't':
+		if s.literal("true") {
+			*p = true
+		}
+	case 'f':
+		if s.literal("false") {
+			*p = false
+		}
+	default:
+		s.fail("expected bool")
+	}
+}
+
+// any 与 encoding/json 解码到 interface{} 的结果相同
+func (s *jsonScanner) any() interface{} {
+	switch s.ws() {
+	case '{':
+		m := map[string]interface{}{}
+		s.objectStart()
+		for i := 0; s.objectNext(i); i++ {
+			key := string(s.key)
+			m[key] = s.any()
+		}
+		return m
+	case '[':
+		a := []interface{}{}
+		s.arrayStart()
+		for i := 0; s.arrayNext(i); i++ {
+			a = append(a, s.any())
+		}
+		return a
+	case '"':
+		return string(s.stringBytes())
+	case 't', 'f':
+		var b bool
+		s.readBool(&b)
+		return b
+	case 'n':
+		s.null()
+		return nil
+	}
+	f, _ := s.float(64)
+	return f
+}
+
+// skip 跳过不认识的字段, 不分配内存
+func (s *jsonScanner) skip() {
+	switch s.ws() {
+	case '{':
+		s.objectStart()
+		for i := 0; s.objectNext(i); i++ {
+			s.skip()
+		}
+	case '[':
+		s.arrayStart()
+		for i := 0; s.arrayNext(i); i++ {
+			s.skip()
+		}
+	case '"':
+		s.stringBytes()
+	case 't':
+		s.literal("true")
+	case 'f':
+		s.literal("false")
+	case 'n':
+		s.literal("null")
+	default:
+		s.float(64)
+	}
+}
+
+func (s *jsonScanner) finish() error {
+	if s.err == nil && s.ws() != 0 {
+		s.fail("unexpected data after top-level value")
+	}
+	return s.err
+}
+
+// jsonWriter 按 encoding/json 的格式写出
+type jsonWriter struct {
+	buf []byte
+	err error
+}
+
+func (w *jsonWriter) raw(s string) {
+	w.buf = append(w.buf, s...)
+}
+
+func (w *jsonWriter) int(n int) {
+	w.buf = strconv.AppendInt(w.buf, int64(n), 10)
+}
+
+func (w *jsonWriter) bool(b bool) {
+	w.buf = strconv.AppendBool(w.buf, b)
+}
+
+func (w *jsonWriter) float(f float64, bits int) {
+	if math.IsInf(f, 0) || math.IsNaN(f) {
+		if w.err == nil {
+			w.err = errors.New("json: unsupported value: " + strconv.FormatFloat(f, 'g', -1, bits))
+		}
+		w.buf = append(w.buf, '0')
+		return
+	}
+	format := byte('f')
+	if abs := math.Abs(f); abs != 0 {
+		if bits == 64 && (abs < 1e-6 || abs >= 1e21) || bits == 32 && (float32(abs) < 1e-6 || float32(abs) >= 1e21) {
+			format = 'e'
+		}
+	}
+	b := strconv.AppendFloat(w.buf, f, format, -1, bits)
+	if format == 'e' {
+		// e-09 写成 e-9
+		if n := len(b); n >= 4 && b[n-4] == 'e' && b[n-3] == '-' && b[n-2] == '0' {
+			b[n-2] = b[n-1]
+			b = b[:n-1]
+		}
+	}
+	w.buf = b
+}
+
+const codecHex = "0123456789abcdef"
+
+func (w *jsonWriter) str(s string) {
+	b := append(w.buf, '"')
+	start := 0
+	for i := 0; i < len(s); {
+		if c := s[i]; c < utf8.RuneSelf {
+			if c >= 0x20 && c != '"' && c != '\\\\' && c != '<' && c != '>' && c != '&' {
+				i++
+				continue
+			}
+			b = append(b, s[start:i]...)
+			switch c {
+			case '"', '\\\\':
+				b = append(b, '\\\\', c)
+			case '\\n':
+				b = append(b, '\\\\', 'n')
+			case '\\r':
+				b = append(b, '\\\\', 'r')
+			case '\\t':
+				b = append(b, '\\\\', 't')
+			default:
+				b = append(b, '\\\\', 'u', '0', '0', codecHex[c>>4], codecHex[c&0xF])
+			}
+			i++
+			start = i
+			continue
+		}
+		r, size := utf8.DecodeRuneInString(s[i:])
+		if r == utf8.RuneError && size == 1 {
+			b = append(b, s[start:i]...)
+			b = append(b, `\\ufffd`...)
+			i += size
+			start = i
+			continue
+		}
+		if r == '\\u2028' || r == '\\u2029' {
+			b = append(b, s[start:i]...)
+			b = append(b, '\\\\', 'u', '2', '0', '2', codecHex[r&0xF])
+			i += size
+			start = i
+			continue
+		}
+		i += size
+	}
+	b = append(b, s[start:]...)
+	w.buf = append(b, '"')
+}
+
+func (w *jsonWriter) any(v interface{}) {
+	switch v := v.(type) {
+	case nil:
+		w.raw("null")
+	case string:
+		w.str(v)
+	case bool:
+		w.bool(v)
+	case float64:
+		w.float(v, 64)
+	case int:
+		w.int(v)
+	case []interface{}:
+		if v == nil {
+			w.raw("null")
+			return
+		}
+		w.buf = append(w.buf, '[')
+		for i, e := range v {
+			if i > 0 {
+				w.buf = append(w.buf, ',')
+			}
+			w.any(e)
+		}
+		w.buf = append(w.buf, ']')
+	case map[string]interface{}:
+		if v == nil {
+			w.raw("null")
+			return
+		}
+		keys := make([]string, 0, len(v))
+		for k := range v {
+			keys = append(keys, k)
+		}
+		sort.Strings(keys)
+		w.buf = append(w.buf, '{')
+		for i, k := range keys {
+			if i > 0 {
+				w.buf = append(w.buf, ',')
+			}
+			w.str(k)
+			w.buf = append(w.buf, ':')
+			w.any(v[k])
+		}
+		w.buf = append(w.buf, '}')
+	default:
+		b, err := stdjson.Marshal(v)
+		if err != nil && w.err == nil {
+			w.err = err
+		}
+		w.buf = append(w.buf, b...)
+	}
+}'''
+
+READERS = {
+    'int': 'readInt',
+    'float32': 'readFloat32',
+    'float64': 'readFloat64',
+    'string': 'readString',
+    'bool': 'readBool',
+}
+
+WRITERS = {
+    'int': 'w.int(%s)',
+    'float32': 'w.float(float64(%s), 32)',
+    'float64': 'w.float(%s, 64)',
+    'string': 'w.str(%s)',
+    'bool': 'w.bool(%s)',
+    'interface{}': 'w.any(%s)',
+}
+
+
+def go_string(s):
+    """go 字符串字面量"""
+    return json.dumps(s, ensure_ascii=False)
+
+
+def json_key(key):
+    """与 encoding/json 一样转义 key, 后面跟上冒号"""
+    text = json.dumps(key, ensure_ascii=False)
+    for c in '<>&\u2028\u2029':
+        text = text.replace(c, '\\u%04x' % ord(c))
+    return text + ':'
+
+
+def decode_lines(type_, target, depth, fresh=False):
+    """把下一个值解码到 target, fresh 表示 target 是刚声明的零值变量"""
+    if type_ in READERS:
+        return [f's.{READERS[type_]}(&{target})']
+    if type_ == 'interface{}':
+        return [f'{target} = s.any()']
+    if type_.startswith('*'):
+        return ['if s.null() {',
+                f'\t{target} = nil',
+                '} else {',
+                f'\t{target} = new({type_[1:]})',
+                f'\ts.{READERS[type_[1:]]}({target})',
+                '}']
+    if type_.startswith('[]'):
+        e, i = f'e{depth}', f'i{depth}'
+        return ([] if fresh else [f'{target} = nil']) + [
+                'if s.arrayStart() {',
+                f'\t{target} = {type_}{{}}',
+                f'\tfor {i} := 0; s.arrayNext({i}); {i}++ {{',
+                f'\t\tvar {e} {type_[2:]}'] + \
+               ['\t\t' + line for line in decode_lines(type_[2:], e, depth + 1, True)] + \
+               [f'\t\t{target} = append({target}, {e})', '\t}', '}']
+    return [f'{target}.decodeJSON(s)']
+
+
+def encode_lines(type_, value, depth):
+    if type_ in WRITERS:
+        return [WRITERS[type_] % value]
+    if type_.startswith('*'):
+        return [f'if {value} == nil {{', '\tw.raw("null")', '} else {'] + \
+               ['\t' + line for line in encode_lines(type_[1:], '*' + value, depth)] + ['}']
+    if type_.startswith('[]'):
+        e, i = f'e{depth}', f'i{depth}'
+        return [f'if {value} == nil {{',
+                '\tw.raw("null")',
+                '} else {',
+                '\tw.raw("[")',
+                f'\tfor {i} := range {value} {{',
+                f'\t\tif {i} > 0 {{',
+                '\t\t\tw.raw(",")',
+                '\t\t}'] + \
+               ['\t\t' + line for line in encode_lines(type_[2:], f'{value}[{i}]', depth + 1)] + \
+               ['\t}', '\tw.raw("]")', '}']
+    return [f'{value}.encodeJSON(w)']
+
+
+def create_codec_strings(structs, roots):
+    """structs 是 package_structs 返回的全部结构体, roots 的名字已经确定"""
+    strings = [GO_RUNTIME]
+    for struct in structs:
+        name = struct.name
+        lines = [f'func (v *{name}) UnmarshalJSON(data []byte) error ' + '{',
+                 '\ts := jsonScanner{data: data}',
+                 '\tv.decodeJSON(&s)',
+                 '\treturn s.finish()',
+                 '}',
+                 '',
+                 f'func (v *{name}) decodeJSON(s *jsonScanner) ' + '{',
+                 '\tif !s.objectStart() {',
+                 '\t\treturn',
+                 '\t}',
+                 '\tfor i := 0; s.objectNext(i); i++ {',
+                 '\t\tswitch string(s.key) {']
+        for field in struct.fields:
+            lines.append(f'\t\tcase {go_string(field.key)}:')
+            lines += ['\t\t\t' + line for line in decode_lines(field.type, 'v.' + field.name, 0)]
+        lines += ['\t\tdefault:',
+                  '\t\t\ts.skip()',
+                  '\t\t}',
+                  '\t}',
+                  '}',
+                  '',
+                  f'func (v {name}) MarshalJSON() ([]byte, error) ' + '{',
+                  '\tw := jsonWriter{}',
+                  '\tv.encodeJSON(&w)',
+                  '\treturn w.buf, w.err',
+                  '}',
+                  '',
+                  f'func (v *{name}) encodeJSON(w *jsonWriter) ' + '{']
+        sep = '{'
+        for field in struct.fields:
+            lines.append(f'\tw.raw({go_string(sep + json_key(field.key))})')
+            lines += ['\t' + line for line in encode_lines(field.type, 'v.' + field.name, 0)]
+            sep = ','
+        lines.append('\tw.raw("}")' if struct.fields else '\tw.raw("{}")')
+        lines.append('}')
+        strings.append('\n'.join(lines))
+
+    for root in roots:
+        name = root.name
+        strings.append('\n'.join([
+            f'// Unmarshal{name}Slice 解码顶层是数组的 json',
+            f'func Unmarshal{name}Slice(data []byte) ([]{name}, error) ' + '{',
+            '\ts := jsonScanner{data: data}',
+            f'\tvar v []{name}',
+            '\tif s.arrayStart() {',
+            f'\t\tv = []{name}' + '{}',
+            '\t\tfor i := 0; s.arrayNext(i); i++ {',
+            f'\t\t\tv = append(v, {name}' + '{})',
+            '\t\t\tv[len(v)-1].decodeJSON(&s)',
+            '\t\t}',
+            '\t}',
+            '\treturn v, s.finish()',
+            '}',
+            '',
+            f'// Unmarshal{name}Map 解码以 id 为 key 的对象(xls2json 导出的格式)',
+            f'func Unmarshal{name}Map(data []byte) (map[string]{name}, error) ' + '{',
+            '\ts := jsonScanner{data: data}',
+            f'\tvar v map[string]{name}',
+            '\tif s.objectStart() {',
+            f'\t\tv = map[string]{name}' + '{}',
+            '\t\tfor i := 0; s.objectNext(i); i++ {',
+            '\t\t\tkey := string(s.key)',
+            f'\t\t\tvar e {name}',
+            '\t\t\te.decodeJSON(&s)',
+            '\t\t\tv[key] = e',
+            '\t\t}',
+            '\t}',
+            '\treturn v, s.finish()',
+            '}']))
+    return strings
+
+
+def create_benchmark_strings(package_path, roots, files):
+    """
+    go test 基准: 同一个文件分别用 encoding/json 反射解码到 plain 包(只有结构体)
+    和用生成的代码解码到 fast 包, 并检查两者重新编码后的结果一致
+    """
+    lines = ['package bench',
+             '',
+             'import (',
+             '\t"bytes"',
+             '\t"encoding/json"',
+             '\t"os"',
+             '\t"testing"',
+             '',
+             f'\tfast {go_string(package_path + "/fast")}',
+             f'\tplain {go_string(package_path + "/plain")}',
+             ')',
+             '',
+             'func load(tb testing.TB, path string) []byte {',
+             '\tdata, err := os.ReadFile(path)',
+             '\tif err != nil {',
+             '\t\ttb.Fatal(err)',
+             '\t}',
+             '\treturn data',
+             '}']
+    for root, path in zip(roots, files):
+        name, path = root.name, go_string(str(path))
+        lines += ['',
+                  f'func Test{name}Same(t *testing.T) ' + '{',
+                  f'\tdata := load(t, {path})',
+                  f'\tvar want []plain.{name}',
+                  '\tif err := json.Unmarshal(data, &want); err != nil {',
+                  '\t\tt.Fatal(err)',
+                  '\t}',
+                  f'\tgot, err := fast.Unmarshal{name}Slice(data)',
+                  '\tif err != nil {',
+                  '\t\tt.Fatal(err)',
+                  '\t}',
+                  '\ta, _ := json.Marshal(want)',
+                  '\tb, err := json.Marshal(got)',
+                  '\tif err != nil || !bytes.Equal(a, b) {',
+                  f'\t\tt.Fatalf("{name}: generated codec differs from encoding/json: %v", err)',
+                  '\t}',
+                  '}',
+                  '',
+                  f'func Benchmark{name}Reflect(b *testing.B) ' + '{',
+                  f'\tdata := load(b, {path})',
+                  '\tb.SetBytes(int64(len(data)))',
+                  '\tb.ReportAllocs()',
+                  '\tfor i := 0; i < b.N; i++ {',
+                  f'\t\tvar v []plain.{name}',
+                  '\t\tif err := json.Unmarshal(data, &v); err != nil {',
+                  '\t\t\tb.Fatal(err)',
+                  '\t\t}',
+                  '\t}',
+                  '}',
+                  '',
+                  f'func Benchmark{name}Generated(b *testing.B) ' + '{',
+                  f'\tdata := load(b, {path})',
+                  '\tb.SetBytes(int64(len(data)))',
+                  '\tb.ReportAllocs()',
+                  '\tfor i := 0; i < b.N; i++ {',
+                  f'\t\tif _, err := fast.Unmarshal{name}Slice(data); err != nil ' + '{',
+                  '\t\t\tb.Fatal(err)',
+                  '\t\t}',
+                  '\t}',
+                  '}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,182 @@
+import re
+from json.decoder import scanstring
+
+# 流式 json 解析: 边读文件边产生 (事件, 值), 事件名与 ijson.basic_parse 一致
+# start_map, map_key, end_map, start_array, end_array, string, number, boolean, null
+# 装了 ijson 时用它的 C 实现, 否则用下面的纯 python 版本
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+number_re = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+ws_re = re.compile(r'[ \t\n\r]*')
+
+
+class ByteCounter:
+    """纯 python 版本已经处理的字节数(与字节预算一样按 utf-8 字节计算), 读 count 时才把新处理的字符编码一次"""
+
+    def __init__(self):
+        self.buf = ''
+        self.pos = 0
+        self.mark = 0  # buf 里已经计入 total 的字符数
+        self.total = 0
+
+    @property
+    def count(self):
+        if self.pos > self.mark:
+            self.total += len(self.buf[self.mark:self.pos].encode('utf-8'))
+            self.mark = self.pos
+        return self.total
+
+    def rebase(self, buf):
+        """当前位置成为新的 buf 的开头"""
+        self.count
+        self.buf = buf
+        self.pos = self.mark = 0
+
+
+def basic_parse(f, chunk_size=1 << 16, counter=None):
+    """从文本文件 f 逐块读取并产生事件, counter 是 ByteCounter, 记录已经处理的字节数"""
+    buf = ''
+    pos = 0
+    consumed = 0
+    eof = False
+    stack = []  # True: 对象, False: 数组
+    expect_key = False
+
+    def refill():
+        nonlocal buf, pos, consumed, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        consumed += pos
+        if counter is not None:
+            counter.pos = pos
+        buf = buf[pos:] + chunk
+        pos = 0
+        if counter is not None:
+            counter.rebase(buf)
+
+    while True:
+        pos = ws_re.match(buf, pos).end()
+        if counter is not None:
+            counter.pos = pos
+        if pos >= len(buf) or (not eof and len(buf) - pos < 8 and buf[pos] not in '{}[],:'):
+            # 当前 token 可能被块边界截断, 先补数据
+            if eof:
+                if pos >= len(buf):
+                    break
+            else:
+                refill()
+                continue
+        ch = buf[pos]
+        if ch == '"':
+            try:
+                s, end = scanstring(buf, pos + 1)
+            except ValueError:
+                if eof:
+                    raise
+                refill()
+                continue
+            pos = end
+            if expect_key:
+                expect_key = False
+                yield 'map_key', s
+            else:
+                yield 'string', s
+        elif ch == '{':
+            pos += 1
+            stack.append(True)
+            expect_key = True
+            yield 'start_map', None
+        elif ch == '}':
+            pos += 1
+            stack.pop()
+            expect_key = False
+            yield 'end_map', None
+        elif ch == '[':
+            pos += 1
+            stack.append(False)
+            yield 'start_array', None
+        elif ch == ']':
+            pos += 1
+            stack.pop()
+            yield 'end_array', None
+        elif ch == ',':
+            pos += 1
+            expect_key = bool(stack) and stack[-1]
+        elif ch == ':':
+            pos += 1
+        elif ch == '-' or '0' <= ch <= '9':
+            m = number_re.match(buf, pos)
+            end = pos + 1 if m is None else m.end()
+            if not eof and (end >= len(buf) or buf[end] in '.eE+-'):
+                # 数字可能在小数点或指数处被块边界截断
+                refill()
+                continue
+            if m is None:
+                raise ValueError(f"Invalid number: char {consumed + pos}")
+            integer, frac, exp = m.groups()
+            pos = m.end()
+            if frac or exp:
+                yield 'number', float(integer + (frac or '') + (exp or ''))
+            else:
+                yield 'number', int(integer)
+        elif buf.startswith('true', pos):
+            pos += 4
+            yield 'boolean', True
+        elif buf.startswith('false', pos):
+            pos += 5
+            yield 'boolean', False
+        elif buf.startswith('null', pos):
+            pos += 4
+            yield 'null', None
+        else:
+            raise ValueError(f"Unexpected character {ch!r}: char {consumed + pos}")
+
+
+class CountingReader:
+    """统计 ijson 已经读走的字节数"""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.count += len(data)
+        return data
+
+
+class EventReader:
+    """with EventReader(path) as events: 逐个产生 (事件, 值), position 为已经读到的位置"""
+
+    def __init__(self, path, chunk_size=1 << 16):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.f = None
+        self.counter = ByteCounter()
+        self.reader = None
+
+    def __enter__(self):
+        if ijson is not None:
+            self.f = open(self.path, 'rb')
+            self.reader = CountingReader(self.f)
+        else:
+            self.f = open(self.path, 'r', encoding='utf-8')
+        return self
+
+    def __exit__(self, *args):
+        self.f.close()
+
+    @property
+    def position(self):
+        if self.reader is not None:
+            return self.reader.count
+        return self.counter.count
+
+    def __iter__(self):
+        if self.reader is not None:
+            return iter(ijson.basic_parse(self.reader, buf_size=self.chunk_size, use_float=True))
+        return basic_parse(self.f, self.chunk_size, self.counter)
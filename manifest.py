@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+
+# 增量导出清单: 记录每个源文件的大小/修改时间/内容哈希, 生成器版本以及产出的文件
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Manifest:
+    def __init__(self, root_dir, store_dir, generator, settings=''):
+        self.root_dir = root_dir
+        self.path = os.path.join(store_dir, '.%s.manifest' % generator)
+        # 生成器版本和导出参数, 任何一项变化都会让所有记录失效
+        self.generator = '%s %s' % (generator, settings)
+        self.entries = {}
+        self.changed = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+            if data.get('generator') == self.generator:
+                self.entries = data.get('files', {})
+            else:
+                self.changed = True
+
+    def key(self, source):
+        return os.path.relpath(str(source), str(self.root_dir)).replace(os.sep, '/')
+
+    def is_fresh(self, source):
+        """源文件与上次导出时一致且产出文件都还在"""
+        entry = self.entries.get(self.key(source))
+        if entry is None:
+            return False
+        if not all(os.path.exists(p) for p in entry['outputs']):
+            return False
+        st = os.stat(source)
+        if entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+            return True
+        if entry['size'] != st.st_size:
+            return False
+        # 只是 mtime 变了(切分支, 重新拷贝), 用内容哈希确认
+        if entry['hash'] != file_hash(source):
+            return False
+        entry['mtime'] = st.st_mtime
+        self.changed = True
+        return True
+
+    def get(self, source, name, default=None):
+        entry = self.entries.get(self.key(source))
+        if entry is None:
+            return default
+        return entry.get(name, default)
+
+    def update(self, source, outputs, **extra):
+        key = self.key(source)
+        old = self.entries.get(key)
+        st = os.stat(source)
+        entry = {
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'hash': file_hash(source),
+            'outputs': list(outputs),
+        }
+        entry.update(extra)
+        self.entries[key] = entry
+        if old is not None:
+            # sheet 改名之后, 旧名字对应的产出文件已经没有来源了
+            self._remove_outputs(set(old['outputs']) - set(outputs))
+        self.changed = True
+
+    def prune(self, sources):
+        """删除源文件已经不存在的记录及其产出文件, 返回被删除的源文件列表"""
+        keep = {self.key(s) for s in sources}
+        removed = [k for k in self.entries if k not in keep]
+        for k in removed:
+            entry = self.entries.pop(k)
+            self._remove_outputs(entry['outputs'])
+            self.changed = True
+        return removed
+
+    def _remove_outputs(self, outputs):
+        alive = set()
+        for entry in self.entries.values():
+            alive.update(entry['outputs'])
+        for p in outputs:
+            if p not in alive and os.path.exists(p):
+                os.remove(p)
+
+    def save(self):
+        if not self.changed:
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'generator': self.generator, 'files': self.entries}, f, ensure_ascii=False, indent=1)
+        self.changed = False
@@ -0,0 +1,36 @@
+import io
+import os
+from contextlib import contextmanager
+
+# 生成文件的写出: 先在内存里拼好, 与已有文件内容相同时不动它(修改时间不变, go build 等不会重做),
+# 不同时写到同目录的临时文件再改名替换, 中途中断也不会留下写了一半的文件
+
+
+def write_file(path, data):
+    """data 为 bytes, 返回文件是否被改写"""
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass  # 文件还不存在
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+
+@contextmanager
+def open_output(path, binary=False):
+    """用法与 codecs.open(path, "w", "utf-8") 相同, binary=True 时写 bytes; 离开 with 时才写文件, 出错时不写"""
+    buffer = io.BytesIO() if binary else io.StringIO(newline='')
+    yield buffer
+    data = buffer.getvalue()
+    write_file(path, data if binary else data.encode('utf-8'))
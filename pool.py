@@ -0,0 +1,11 @@
+from concurrent.futures import ProcessPoolExecutor
+
+# 多进程导出: 结果总是按输入顺序返回, 与各进程完成的先后无关
+
+
+def run(func, items, jobs=1):
+    items = list(items)
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(items))) as executor:
+        return list(executor.map(func, items))
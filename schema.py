@@ -0,0 +1,529 @@
+import json
+import random
+import re
+import time
+from typing import Any
+
+# 结构推断: 一遍扫描所有数据, 把每个位置上见过的类型合并到同一个节点里
+# 可选字段取并集, int 与 float 合并成 float, null 变成可空, 嵌套对象逐字段合并
+
+BOOL = 1
+INT = 2
+FLOAT = 4
+STR = 8
+OBJECT = 16
+ARRAY = 32
+
+kind_bits = {
+    bool: BOOL,
+    int: INT,
+    float: FLOAT,
+    str: STR,
+    dict: OBJECT,
+    list: ARRAY,
+}
+
+go_types = {
+    BOOL: "bool",
+    INT: "int",
+    FLOAT: "float32",
+    INT | FLOAT: "float32",
+    STR: "string",
+}
+
+
+class TypeInfo:
+    __slots__ = ('kinds', 'nullable', 'count', 'fields', 'items')
+
+    def __init__(self):
+        self.kinds = 0  # 见过的类型, kind_bits 的按位或
+        self.nullable = False
+        self.count = 0  # 非 null 的值的个数
+        self.fields = None  # 对象: 字段名 -> TypeInfo, 按第一次出现的顺序
+        self.items = None  # 数组: 所有元素合并后的 TypeInfo
+
+    def add(self, value: Any):
+        if value is None:
+            self.nullable = True
+            return
+        bit = kind_bits.get(type(value))
+        if bit is None:
+            bit = OBJECT if isinstance(value, dict) else ARRAY if isinstance(value, list) else STR
+        self.kinds |= bit
+        self.count += 1
+        if bit == OBJECT:
+            fields = self.fields
+            if fields is None:
+                fields = self.fields = {}
+            for k, v in value.items():
+                field = fields.get(k)
+                if field is None:
+                    field = fields[k] = TypeInfo()
+                field.add(v)
+        elif bit == ARRAY:
+            items = self.items
+            if items is None:
+                items = self.items = TypeInfo()
+            for v in value:
+                items.add(v)
+
+    def add_all(self, values):
+        for v in values:
+            self.add(v)
+        return self
+
+
+class EventInfer:
+    """把解析事件直接合并进 TypeInfo, 不构建文档树"""
+    __slots__ = ('root', 'node', 'stack')
+
+    def __init__(self, root: TypeInfo):
+        self.root = root
+        self.node = root  # 下一个值要合并进去的节点
+        self.stack = []  # (容器节点, 是否数组)
+
+    def feed(self, event, value):
+        node = self.node
+        if event == 'map_key':
+            fields = self.stack[-1][0].fields
+            field = fields.get(value)
+            if field is None:
+                field = fields[value] = TypeInfo()
+            self.node = field
+            return
+        if event == 'start_map':
+            node.kinds |= OBJECT
+            node.count += 1
+            if node.fields is None:
+                node.fields = {}
+            self.stack.append((node, False))
+            return
+        if event == 'start_array':
+            node.kinds |= ARRAY
+            node.count += 1
+            if node.items is None:
+                node.items = TypeInfo()
+            self.stack.append((node, True))
+            self.node = node.items
+            return
+        if event == 'end_map' or event == 'end_array':
+            self.stack.pop()
+        else:
+            node.add(value)
+        # 一个值结束: 数组里的下一个值还是数组元素, 对象里的等下一个 key
+        stack = self.stack
+        if not stack:
+            self.node = self.root
+        elif stack[-1][1]:
+            self.node = stack[-1][0].items
+
+
+def build_records(events, position):
+    """顶层数组的元素逐个构建成 python 对象, 返回 (记录, 记录开始时读到的位置); 顶层不是数组时整个文档是一条记录"""
+    stack = []
+    keys = []
+    top_array = None
+    for event, value in events:
+        if top_array is None:
+            top_array = event == 'start_array'
+            if top_array:
+                continue
+        if not stack:
+            start = position()
+        if event == 'map_key':
+            keys[-1] = value
+            continue
+        if event == 'start_map' or event == 'start_array':
+            stack.append({} if event == 'start_map' else [])
+            keys.append(None)
+            continue
+        if event == 'end_map' or event == 'end_array':
+            if not stack:
+                return  # 顶层数组结束
+            value = stack.pop()
+            keys.pop()
+        if not stack:
+            yield value, start
+            continue
+        parent = stack[-1]
+        if isinstance(parent, list):
+            parent.append(value)
+        else:
+            parent[keys[-1]] = value
+
+
+def infer(data) -> TypeInfo:
+    return TypeInfo().add_all([data])
+
+
+def go_type(info: TypeInfo):
+    """基本类型和基本类型数组的 go 类型; 对象返回 None, 由调用方生成结构体"""
+    kinds = info.kinds
+    if kinds in go_types:
+        return ("*" if info.nullable else "") + go_types[kinds]
+    if kinds == ARRAY:
+        depth = 1
+        items = info.items
+        while items.kinds == ARRAY:
+            depth += 1
+            items = items.items
+        if items.kinds == OBJECT:
+            return None
+        item_type = go_type(items) if items.kinds else "interface{}"
+        return "[]" * depth + item_type
+    if kinds == OBJECT:
+        return None
+    # 从来没见过值(只有 null), 或者同一字段出现了不兼容的类型
+    return "interface{}"
+
+
+def array_depth(info: TypeInfo):
+    depth = 0
+    while info.kinds == ARRAY:
+        depth += 1
+        info = info.items
+    return depth, info
+
+
+def generate_field_name(field_name: str) -> str:
+    """
+    Turns a snake_case field name into a PascalCase field name.
+    """
+    split_snake = field_name.split("_")
+    if len(split_snake) == 1:
+        struct_name = f"{field_name[0].upper()}{field_name[1:]}"
+    else:
+        split_snake = [s.capitalize() for s in split_snake]
+
+        struct_name = "".join(split_snake)
+
+    return struct_name
+
+
+class GoField:
+    __slots__ = ('key', 'name', 'type', 'struct', 'depth')
+
+    def __init__(self, key, name, type_, struct=None, depth=0):
+        self.key = key  # json 里的字段名
+        self.name = name  # go 字段名
+        self.type = type_  # go 类型
+        self.struct = struct  # 字段类型是结构体(或结构体数组)时指向它
+        self.depth = depth  # 结构体外面套了几层 []
+
+
+class GoStruct:
+    __slots__ = ('name', 'fields', 'comment', 'indexes')
+
+    def __init__(self, name, comment=None):
+        self.name = name
+        self.fields = []
+        self.comment = comment
+        self.indexes = None  # 按 id 查找的表格行: [(字段 key, 是否唯一)], 其他结构体为 None
+
+
+def build_struct(info: TypeInfo, struct_name) -> GoStruct:
+    """由合并后的 TypeInfo 生成结构体节点, 每个节点只访问一次"""
+    struct = GoStruct(struct_name)
+    for k, field in info.fields.items():
+        field_name = generate_field_name(k)
+        type_ = go_type(field)
+        nested = None
+        depth = 0
+        if type_ is None:
+            depth, items = array_depth(field)
+            nested = build_struct(items, field_name + "List" if depth else field_name)
+            type_ = "[]" * depth + nested.name
+        struct.fields.append(GoField(k, field_name, type_, nested, depth))
+    return struct
+
+
+def struct_to_dict(struct: GoStruct) -> dict:
+    """转成可以存进 json 清单的形式"""
+    return {
+        "name": struct.name,
+        "comment": struct.comment,
+        "indexes": struct.indexes,
+        "fields": [[f.key, f.name, f.type, f.depth, struct_to_dict(f.struct) if f.struct else None]
+                   for f in struct.fields],
+    }
+
+
+def struct_from_dict(data: dict) -> GoStruct:
+    struct = GoStruct(data["name"], data["comment"])
+    struct.indexes = data.get("indexes")
+    for key, name, type_, depth, nested in data["fields"]:
+        struct.fields.append(GoField(key, name, type_, struct_from_dict(nested) if nested else None, depth))
+    return struct
+
+
+def iter_structs(struct: GoStruct):
+    """先父后子, 依次返回所有结构体"""
+    yield struct
+    for field in struct.fields:
+        if field.struct is not None:
+            yield from iter_structs(field.struct)
+
+
+class TypeRegistry:
+    """
+    一次运行里所有文件共用的类型表: 结构相同(字段名和字段类型都相同)的
+    嵌套结构体只生成一次, 名字冲突时按注册顺序改名, 顶层结构体总是保留自己的名字
+    """
+
+    def __init__(self):
+        self.shapes = {}  # 结构签名 -> GoStruct
+        self.names = set()
+        self.reserved = set()  # 顶层结构体的名字, 嵌套结构体不能占用
+        self.structs = []  # 按生成顺序排列的结构体
+
+    def reserve(self, names):
+        self.reserved.update(names)
+
+    def unique_name(self, name, owner, is_root):
+        if name not in self.names and (is_root or name not in self.reserved):
+            return name
+        candidate = name if is_root else owner + name
+        n = 2
+        while candidate in self.names or (not is_root and candidate in self.reserved):
+            candidate = f"{name if is_root else owner + name}{n}"
+            n += 1
+        return candidate
+
+    def add(self, root: GoStruct) -> GoStruct:
+        new = []
+        root = self._canonical(root, root.name, True, new)
+        # 与 iter_structs 一样先父后子, 只输出这次新增的结构体
+        new = set(map(id, new))
+        seen = set()
+        stack = [root]
+        while stack:
+            struct = stack.pop()
+            if id(struct) in seen:
+                continue
+            seen.add(id(struct))
+            if id(struct) in new:
+                self.structs.append(struct)
+            stack.extend(f.struct for f in reversed(struct.fields) if f.struct is not None)
+        return root
+
+    def _canonical(self, struct, owner, is_root, new):
+        for field in struct.fields:
+            if field.struct is not None:
+                field.struct = self._canonical(field.struct, owner, False, new)
+                field.type = "[]" * field.depth + field.struct.name
+        shape = tuple((f.key, f.name, f.type) for f in struct.fields)
+        if not is_root and shape in self.shapes:
+            return self.shapes[shape]
+        struct.name = self.unique_name(struct.name, owner, is_root)
+        self.names.add(struct.name)
+        self.shapes.setdefault(shape, struct)
+        new.append(struct)
+        return struct
+
+
+def render_structs(structs, omit_empty=True):
+    """
+    Turns struct nodes into multiline strings which can get
+    written to a .go file.
+    """
+    struct_strings = []
+    for u in structs:
+        lines = [u.comment] if u.comment else []
+        lines.append(f"type {u.name} struct " + "{")
+        for field in u.fields:
+            if omit_empty:
+                struct_tag = f"`json:\"{field.key},omitempty\"`"
+            else:
+                struct_tag = f"`json:\"{field.key}\"`"
+            lines.append(f"\t{field.name}\t{field.type}\t{struct_tag}")
+        lines.append("}")
+        struct_strings.append("\n".join(lines))
+    return struct_strings
+
+
+def create_struct_strings(struct: GoStruct, omit_empty=True):
+    return render_structs(iter_structs(struct), omit_empty)
+
+
+def package_structs(roots):
+    """多个文件的顶层结构体放进同一个 go 包: 相同结构只保留一个, 名字不冲突, 按生成顺序返回"""
+    registry = TypeRegistry()
+    registry.reserve(root.name for root in roots)
+    for root in roots:
+        registry.add(root)
+    return registry.structs
+
+
+def create_package_strings(roots, omit_empty=True):
+    return render_structs(package_structs(roots), omit_empty)
+
+
+class Sampler:
+    """
+    推断预算: 最多读多少条记录(limit), 蓄水池抽样(sample, 固定 seed),
+    时间上限(seconds)和字节上限(max_bytes), 0 表示不限制
+    """
+
+    def __init__(self, limit=0, sample=0, seed=0, seconds=0, max_bytes=0):
+        self.limit = limit
+        self.sample = sample
+        self.seed = seed
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+
+    def run(self, info: TypeInfo, records):
+        """
+        records 按顺序给出 (记录, 记录开始处的字节位置), 返回 (读过的条数, 参与推断的条数, 停止原因).
+        与 run_events 一样, 第一条记录和开始位置在字节预算内的记录都会读完整
+        """
+        deadline = time.monotonic() + self.seconds if self.seconds else None
+        rng = random.Random(self.seed)
+        reservoir = []
+        seen = 0
+        reason = None
+        for record, offset in records:
+            if self.limit and seen >= self.limit:
+                reason = 'limit'
+                break
+            if self.max_bytes and seen and offset > self.max_bytes:
+                reason = 'bytes'
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                reason = 'time'
+                break
+            seen += 1
+            if not self.sample:
+                info.add(record)
+            elif len(reservoir) < self.sample:
+                reservoir.append(record)
+            else:
+                j = rng.randrange(seen)
+                if j < self.sample:
+                    reservoir[j] = record
+        if self.sample:
+            info.add_all(reservoir)
+            return seen, len(reservoir), reason
+        return seen, seen, reason
+
+    def run_events(self, info: TypeInfo, events, position):
+        """
+        与 run 相同, 但输入是解析事件; position() 返回已经读到的位置.
+        不抽样时事件直接合并进 info, 内存占用只与结构的大小有关
+        """
+        if self.sample:
+            # 蓄水池需要保留完整的记录
+            return self.run(info, build_records(events, position))
+        deadline = time.monotonic() + self.seconds if self.seconds else None
+        feeder = EventInfer(info)
+        events = iter(events)
+        first = next(events, None)
+        if first is None:
+            return 0, 0, None
+        if first[0] != 'start_array':
+            # 顶层不是数组, 整个文档就是一条记录
+            feeder.feed(*first)
+            for event, value in events:
+                feeder.feed(event, value)
+            return 1, 1, None
+        seen = 0
+        reason = None
+        for event, value in events:
+            if not feeder.stack:
+                # 顶层数组的一个元素开始了
+                if event == 'end_array':
+                    break
+                if self.limit and seen >= self.limit:
+                    reason = 'limit'
+                    break
+                if self.max_bytes and seen and position() > self.max_bytes:
+                    reason = 'bytes'
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    reason = 'time'
+                    break
+                seen += 1
+            feeder.feed(event, value)
+        return seen, seen, reason
+
+    def comment(self, name, stats):
+        seen, sampled, reason = stats
+        text = f"// {name}: inferred from {sampled} of {seen} records read"
+        if self.sample:
+            text += f" (reservoir sample, seed {self.seed})"
+        if reason is not None:
+            text += f", stopped by {reason} budget"
+        return text
+
+
+ws_re = re.compile(r'[ \t\n\r]*')
+
+
+def iter_records(text, more=None, max_bytes=0):
+    """
+    顶层数组逐个元素解码, 不一次性构建整个文档, 返回 (元素, 元素开始处的字节位置).
+    more 不为空时 text 只是文件的开头, more() 返回后面的内容, 读完时返回空串; 元素被截断时读到它完整为止.
+    第一个元素总是读完整; 之后开始位置超出 max_bytes 的元素不再读取和解码, 只给出 (None, 开始位置), 由 Sampler.run 按字节预算停止
+    """
+    decoder = json.JSONDecoder()
+    eof = more is None
+    done = 0  # text[:mark] 之前的字节数, 已经读过的部分会丢掉
+    mark = 0
+
+    def offset(pos):
+        nonlocal done, mark
+        done += len(text[mark:pos].encode('utf-8'))
+        mark = pos
+        return done
+
+    def refill(pos):
+        """丢掉 pos 之前的内容并补数据, 返回 pos 在新的 text 里的位置"""
+        nonlocal text, mark, eof
+        offset(pos)
+        chunk = more()
+        eof = not chunk
+        text = text[pos:] + chunk
+        mark = 0
+        return 0
+
+    def skip(pos):
+        while True:
+            pos = ws_re.match(text, pos).end()
+            if pos < len(text) or eof:
+                return pos
+            pos = refill(pos)
+
+    pos = skip(0)
+    if not text.startswith('[', pos):
+        while not eof:
+            pos = refill(pos)
+        yield decoder.decode(text), offset(pos)
+        return
+    pos = skip(pos + 1)
+    if text.startswith(']', pos):
+        return
+    first = True
+    while True:
+        start = offset(pos)
+        if max_bytes and not first and start > max_bytes:
+            yield None, start
+            return
+        while True:
+            try:
+                value, end = decoder.raw_decode(text, pos)
+            except ValueError:
+                if eof:
+                    raise
+                pos = refill(pos)
+                continue
+            if end < len(text) or eof:
+                break
+            pos = refill(pos)  # 数字可能还没有读完
+        yield value, start
+        first = False
+        pos = skip(end)
+        if text.startswith(',', pos):
+            pos = skip(pos + 1)
+        elif text.startswith(']', pos):
+            return
+        else:
+            raise ValueError(f"Expecting ',' delimiter: char {pos}")
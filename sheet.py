@@ -0,0 +1,301 @@
+import os
+import re
+import xlsx
+
+# 表格的中间表示: 每个工作簿只读一次, 再交给 json/lua/go 各个导出器
+
+HEADER_ROWS = 3  # 0:注释 1:lua字段名 2:json/go字段名, 之后是数据行
+READER_VERSION = '2'  # 读表和单元格转换的结果变化时加一, 让磁盘缓存失效
+
+# 文本单元格里写的数字, 只用来识别文本格式的 id 列
+number_re = re.compile(r'\s*-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?\s*$')
+
+
+def row_id(value):
+    """数据行返回 int 类型的 id, 配置行(id 不是数字)返回 None"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    if number_re.match(value):
+        return int(float(value))
+    return None
+
+
+def convert_cells(rows, types):
+    """按单元格类型转换数字: 整数转成 int, 其余保持 float, 不需要再逐个猜测字符串是不是数字"""
+    NUMBER = xlsx.XL_CELL_NUMBER
+    for values, row_types in zip(rows, types):
+        for col, t in enumerate(row_types):
+            if t == NUMBER:
+                value = values[col]
+                if value.is_integer():
+                    values[col] = int(value)
+
+
+class SheetError(ValueError):
+    """表格内容与表头声明的类型不符"""
+
+
+# 字段名后面可以声明类型和取值范围, 例如 id:int, level:int[1,100], rate:float[0,1], kind:int{1,2,3}, open:bool
+# 最后还可以加上 index(生成按这一列查找的索引) 或 unique(索引, 并且这一列的值不能重复), 例如 name:string unique
+decl_re = re.compile(r'^\s*([^:]*?)\s*:\s*(\w+)\s*(?:\[([^,\]]*),([^\]]*)\]|\{([^}]*)\})?\s*(index|unique)?\s*$')
+BAD = object()  # 转换失败
+
+
+def to_int(value):
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return BAD  # 整数已经在读表时转成了 int
+    if number_re.match(value):
+        value = float(value)
+        return int(value) if value.is_integer() else BAD
+    return BAD
+
+
+def to_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(value) if number_re.match(value) else BAD
+
+
+def to_string(value):
+    if isinstance(value, str):
+        return value
+    return str(value) if isinstance(value, int) else repr(value)
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return {'true': True, 'false': False, '1': True, '0': False}.get(value.strip().lower(), BAD)
+    return bool(value) if value in (0, 1) else BAD
+
+
+CONVERTERS = {
+    'int': to_int,
+    'float': to_float,
+    'string': to_string,
+    'bool': to_bool,
+}
+
+
+class Column:
+    """表头上声明的一列: 类型, 闭区间范围或枚举, 索引"""
+    __slots__ = ('name', 'type', 'low', 'high', 'enum', 'index')
+
+    def __init__(self, name, type, low=None, high=None, enum=None, index=None):
+        self.name = name
+        self.type = type
+        self.low = low
+        self.high = high
+        self.enum = enum
+        self.index = index  # None, 'index' 或 'unique'
+
+    @classmethod
+    def parse(cls, text):
+        m = decl_re.match(text)
+        if m is None or m.group(2) not in CONVERTERS:
+            raise SheetError(f'无法识别的字段声明 {text!r}, 类型只能是 {"/".join(CONVERTERS)}')
+        name, type, low, high, enum, index = m.groups()
+        convert = CONVERTERS[type]
+        col = cls(name, type, index=index)
+        bounds = [convert(v.strip()) if v.strip() else None for v in (low or '', high or '')]
+        if enum is not None:
+            col.enum = set(convert(v.strip()) for v in enum.split(','))
+            bad = BAD in col.enum
+        else:
+            col.low, col.high = bounds
+            bad = BAD in bounds
+        if bad:
+            raise SheetError(f'字段声明 {text!r} 里的取值与类型 {type} 不符')
+        return col
+
+    def check(self, values):
+        """整列转换和检查, 返回 (转换后的值, [(下标, 原始值, 错误说明)])"""
+        convert = CONVERTERS[self.type]
+        converted = [v if v == '' else convert(v) for v in values]
+        errors = [(i, values[i], f'不是 {self.type}') for i, v in enumerate(converted) if v is BAD]
+        filled = [(i, v) for i, v in enumerate(converted) if v != '' and v is not BAD]
+        if self.enum is not None:
+            errors += [(i, values[i], f'不在 {sorted(self.enum)} 中') for i, v in filled if v not in self.enum]
+        if self.low is not None:
+            errors += [(i, values[i], f'小于 {self.low}') for i, v in filled if v < self.low]
+        if self.high is not None:
+            errors += [(i, values[i], f'大于 {self.high}') for i, v in filled if v > self.high]
+        return converted, errors
+
+
+class Sheet:
+    def __init__(self, name, header, rows, types):
+        self.name = name
+        self.header = header
+        self.rows = rows
+        self.types = types  # 与 rows 对应的 xlrd 单元格类型
+        self.columns = {}  # 列号 -> 表头上声明了类型的 Column
+
+    def title(self, n):
+        return self.header[n] if n < len(self.header) else []
+
+    def ids(self):
+        return [row[0] for row in self.rows]
+
+    def column(self, col, rows=None):
+        """按列取值, rows 为行号列表, 默认全部行"""
+        if rows is None:
+            return [row[col] for row in self.rows]
+        return [self.rows[i][col] for i in rows]
+
+
+def is_declaration(text):
+    """字段名是不是类型声明; 类型不认识的(例如字段名里本来就有冒号)按普通字段名处理"""
+    if not isinstance(text, str) or ':' not in text:
+        return False
+    m = decl_re.match(text)
+    return m is not None and m.group(2) in CONVERTERS
+
+
+def declare(sh, source=''):
+    """
+    解析字段名上的类型声明, 按列批量转换并检查范围和枚举, 有错误时抛出 SheetError.
+    只有声明了类型的 id 列和 unique 列检查重复(id 为 0 的占位行除外), 没有声明的表原样返回
+    """
+    for n in (2, 1):  # json/go 字段名上的声明优先
+        title = sh.title(n)
+        for col, text in enumerate(title):
+            if is_declaration(text):
+                column = Column.parse(text)
+                title[col] = column.name
+                sh.columns.setdefault(col, column)
+    if not sh.columns:
+        return sh
+
+    # 只检查数据行, 配置行是 key/value 形式
+    data = [i for i, row in enumerate(sh.rows) if row_id(row[0]) is not None]
+    errors = []
+    for col, column in sorted(sh.columns.items()):
+        converted, bad = column.check(sh.column(col, data))
+        errors += [(data[i], column.name, value, message) for i, value, message in bad]
+        if not bad:
+            for i, value in zip(data, converted):
+                sh.rows[i][col] = value
+    # 声明了类型的 id 列和 unique 列不能有重复的值
+    for col, column in sorted(sh.columns.items()):
+        if col != 0 and column.index != 'unique':
+            continue
+        seen = {}
+        for i in data:
+            value = row_id(sh.rows[i][0]) if col == 0 else sh.rows[i][col]
+            if value == '' or (col == 0 and value == 0):
+                continue  # xls2lua 跳过 id 为 0 的占位行
+            if value in seen:
+                errors.append((i, column.name, value, f'与第 {seen[value] + HEADER_ROWS + 1} 行重复'))
+            else:
+                seen[value] = i
+    if errors:
+        errors.sort(key=lambda e: e[0])
+        lines = [f'{source} [{sh.name}] 有 {len(errors)} 处错误:']
+        lines += [f'  第 {i + HEADER_ROWS + 1} 行 {name} 列: {value!r} {message}' for i, name, value, message in errors[:20]]
+        if len(errors) > 20:
+            lines.append('  ...')
+        raise SheetError('\n'.join(lines))
+    return sh
+
+
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # 老的 .xls(OLE2 复合文档)的文件头
+
+
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def is_xls(source):
+    """source 是路径时看扩展名, 是二进制文件对象时看文件头"""
+    if is_path(source):
+        return str(source).lower().endswith('.xls')
+    pos = source.tell()
+    magic = source.read(len(OLE_MAGIC))
+    source.seek(pos)
+    return magic == OLE_MAGIC
+
+
+def select_sheets(names, sheets=''):
+    """
+    要导出的 sheet 的下标: sheets 为空时只导出第一个(以前的行为), '*' 导出全部,
+    否则是逗号分隔的名字前缀, 例如 'Cfg,@' 导出名字以 Cfg 或 @ 开头的 sheet
+    """
+    if not sheets:
+        return [0] if names else []
+    if sheets == '*':
+        return list(range(len(names)))
+    prefixes = tuple(p.strip() for p in sheets.split(',') if p.strip())
+    return [i for i, name in enumerate(names) if name.startswith(prefixes)]
+
+
+def load_xls(json_file, sheets=''):
+    import xlrd  # 只有老的 .xls 文件才需要 xlrd
+    wb = xlrd.open_workbook(json_file) if is_path(json_file) else xlrd.open_workbook(file_contents=json_file.read())
+    parsed = []
+    with wb:
+        for index in select_sheets(wb.sheet_names(), sheets):
+            sh = wb.sheet_by_index(index)  # sheet页
+            values = [sh.row_values(rownum) for rownum in range(sh.nrows)]
+            types = [sh.row_types(rownum) for rownum in range(HEADER_ROWS, sh.nrows)]
+            convert_cells(values[HEADER_ROWS:], types)
+            parsed.append((sh.name, values[:HEADER_ROWS], values[HEADER_ROWS:], types))
+    return parsed
+
+
+def read_rows(sh):
+    header = []
+    rows = []
+    types = []
+    ncols = 0
+    for values, row_types in sh.iter_rows():
+        ncols = max(ncols, len(values))
+        if len(header) < HEADER_ROWS:
+            header.append(values)
+        else:
+            rows.append(values)
+            types.append(row_types)
+    # 没有 <dimension> 时各行长度可能不同, 补齐成与 xlrd 一样的矩形
+    for values in header + rows:
+        if len(values) < ncols:
+            values.extend([''] * (ncols - len(values)))
+    for row_types in types:
+        if len(row_types) < ncols:
+            row_types.extend([xlsx.XL_CELL_EMPTY] * (ncols - len(row_types)))
+    convert_cells(rows, types)
+    return sh.name, header, rows, types
+
+
+def read_sheets(json_file, sheets=''):
+    """
+    打开一次工作簿, 读取 select_sheets 选中的 sheet, 返回 [(name, header, rows, types)], 还没有处理表头上的声明.
+    共享字符串表每个工作簿只解析一次. json_file 可以是路径, 也可以是可以 seek 的二进制文件对象
+    """
+    if is_xls(json_file):
+        return load_xls(json_file, sheets)
+    with xlsx.open_workbook(json_file) as wb:
+        return [read_rows(wb.sheet_by_index(index)) for index in select_sheets(wb.sheet_names(), sheets)]
+
+
+def load_sheets(json_file, cache=None, sheets=''):
+    """cache 是 sheetcache.SheetCache 时, 内容没有变化的工作簿直接读取上次的解析结果(只对路径有效)"""
+    if cache is None or not is_path(json_file):
+        source = json_file if is_path(json_file) else getattr(json_file, 'name', '<内存>')
+        return [declare(Sheet(*parsed), source) for parsed in read_sheets(json_file, sheets)]
+    path = cache.path(json_file, sheets)
+    parsed = cache.get(path)
+    if parsed is None:
+        parsed = read_sheets(json_file, sheets)
+        cache.put(path, parsed)
+    return [declare(Sheet(*p), json_file) for p in parsed]
+
+
+def load_sheet(json_file, cache=None):
+    """只读取第一个 sheet"""
+    sheets = load_sheets(json_file, cache)
+    if not sheets:
+        raise SheetError(f'{json_file} 里没有 sheet')
+    return sheets[0]
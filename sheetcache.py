@@ -0,0 +1,86 @@
+import hashlib
+import marshal
+import os
+import tempfile
+from manifest import file_hash
+from sheet import READER_VERSION
+
+# 解析结果的磁盘缓存: 按工作簿内容哈希和读表版本保存表头、转换过类型的行和单元格类型,
+# 切分支或清空输出目录之后, 内容没变的工作簿不需要再解压和解析 xml
+# 用 marshal 保存, 单元格类型每个只占一个字节; 超过上限时删除最久没有用过的缓存
+
+MAGIC = b'XLSC'
+FORMAT = 2  # 缓存文件的格式, 变化时加一
+SUFFIX = '.sheet'
+
+
+class SheetCache:
+    def __init__(self, cache_dir, max_bytes=512 << 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 读表代码、缓存格式或 python 的 marshal 格式变化时, 旧的缓存自然失效
+        self.version = '%s-%d-%d' % (READER_VERSION, FORMAT, marshal.version)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, source, sheets=''):
+        """缓存文件的路径, 由工作簿内容和选择 sheet 的方式决定"""
+        selected = hashlib.sha1(sheets.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.cache_dir, '%s-%s-%s%s' % (file_hash(source), selected, self.version, SUFFIX))
+
+    def get(self, path):
+        """返回 [(name, header, rows, types)], 没有缓存或缓存损坏时返回 None"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if data[:4] != MAGIC:
+            return None
+        try:
+            parsed = [(name, header, rows, [list(t) for t in types])
+                      for name, header, rows, types in marshal.loads(data[4:])]
+        except (ValueError, EOFError, TypeError):
+            return None
+        try:
+            os.utime(path)  # 修改时间作为最近使用时间, 淘汰时使用
+        except OSError:
+            pass
+        return parsed
+
+    def put(self, path, parsed):
+        data = MAGIC + marshal.dumps([(name, header, rows, [bytes(t) for t in types])
+                                      for name, header, rows, types in parsed])
+        # 先写临时文件再改名, 多个进程同时写同一个缓存也不会读到半个文件
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        """总大小超过上限时, 从最久没有用过的开始删除"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(SUFFIX):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        for mtime, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # 其他进程已经删掉了
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 导出脚本都在仓库根目录下, 不是安装的包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import json2struct
+import jsonevents
+from schema import Sampler, create_package_strings
+
+RECORDS = [
+    {'id': 1, 'name': '剑', 'stats': {'hp': 10, 'atk': 2.5}},
+    {'id': 2, 'name': 'shield', 'tags': ['x', 'é'], 'rate': 12345678.125},
+    {'id': 3, 'name': '弓', 'stats': {'hp': 11, 'atk': 3, 'crit': True}},
+    {'id': 4, 'extra': None, 'grid': [[1, 2], [3]]},
+]
+
+
+def render(path, max_bytes, stream):
+    root = json2struct.parseFile(str(path), Sampler(max_bytes=max_bytes), stream)
+    return create_package_strings([root], False) if root is not None else None
+
+
+@pytest.fixture(autouse=True)
+def pure_python(monkeypatch):
+    # ijson 按块统计读到的位置, 只有纯 python 版本的位置与元素的开始处一致
+    monkeypatch.setattr(jsonevents, 'ijson', None)
+
+
+@pytest.mark.parametrize('text', [
+    json.dumps(RECORDS, ensure_ascii=False),
+    json.dumps(RECORDS, ensure_ascii=False, indent=2),
+    json.dumps(RECORDS[0], ensure_ascii=False),
+])
+def test_byte_budget_matches_stream(tmp_path, text):
+    path = tmp_path / 'Bench.json'
+    path.write_bytes(text.encode('utf-8'))
+    for max_bytes in range(1, len(text.encode('utf-8')) + 2):
+        expected = render(path, max_bytes, True)
+        assert expected is not None
+        assert render(path, max_bytes, False) == expected, max_bytes
@@ -0,0 +1,47 @@
+import io
+import json
+
+import jsonevents
+
+DOC = json.dumps({
+    'ints': [0, -7, 123456789012, 42],
+    'floats': [12345678.5, -0.000125, 1.25e+10, 6.02e-23, 3.0],
+    'text': ['', 'a"b\\c', '中文', 'é\n\t'],
+    'flags': [True, False, None],
+    'nested': {'k': [{'x': 1.5}, [], {}]},
+}, ensure_ascii=False)
+
+
+def build(events):
+    """把事件还原成 python 对象"""
+    stack = [[]]
+    keys = []
+    for event, value in events:
+        if event in ('start_map', 'start_array'):
+            stack.append({} if event == 'start_map' else [])
+            continue
+        if event == 'map_key':
+            keys.append(value)
+            continue
+        if event in ('end_map', 'end_array'):
+            value = stack.pop()
+        top = stack[-1]
+        if isinstance(top, dict):
+            top[keys.pop()] = value
+        else:
+            top.append(value)
+    return stack[0][0]
+
+
+def test_every_chunk_size():
+    expected = json.loads(DOC)
+    for chunk_size in range(1, len(DOC) + 2):
+        events = jsonevents.basic_parse(io.StringIO(DOC), chunk_size)
+        assert build(events) == expected, chunk_size
+
+
+def test_byte_counter_counts_utf8():
+    counter = jsonevents.ByteCounter()
+    for _ in jsonevents.basic_parse(io.StringIO(DOC), 7, counter):
+        pass
+    assert counter.count == len(DOC.encode('utf-8'))
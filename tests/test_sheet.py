@@ -0,0 +1,34 @@
+import pytest
+
+from sheet import Sheet, SheetError, declare
+
+
+def make(names, rows):
+    header = [list(names), list(names), list(names)]
+    return Sheet('T', header, [list(row) for row in rows], [[2] * len(names) for _ in rows])
+
+
+def test_undeclared_sheet_untouched():
+    sh = make(['id', 'name'], [[1, 'a'], [1, 'b'], ['2', 'c']])
+    assert declare(sh).rows == [[1, 'a'], [1, 'b'], ['2', 'c']]
+    assert sh.columns == {}
+
+
+def test_unknown_type_is_field_name():
+    sh = declare(make(['id', 'url:http'], [[1, 'x']]))
+    assert sh.title(2) == ['id', 'url:http'] and sh.columns == {}
+
+
+def test_declared_id_duplicates():
+    with pytest.raises(SheetError, match='重复'):
+        declare(make(['id:int', 'name'], [[1, 'a'], [1, 'b']]))
+
+
+def test_declared_id_allows_zero_placeholders():
+    sh = declare(make(['id:int', 'name'], [[0, ''], [1, 'a'], [0, '']]))
+    assert sh.ids() == [0, 1, 0]
+
+
+def test_unique_column_duplicates():
+    with pytest.raises(SheetError, match='重复'):
+        declare(make(['id', 'name:string unique'], [[1, 'a'], [2, 'a']]))
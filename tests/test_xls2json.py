@@ -0,0 +1,31 @@
+import xls2json
+from sheet import Sheet
+
+
+def config_sheet():
+    header = [['键', '值'], ['key', 'value'], ['key', 'value']]
+    rows = [['maxLevel', 60], ['title', 'hello'], ['icons', '[1,2]'], ['icon', 'hello']]
+    return Sheet('Cfg', header, rows, [[1, 2], [1, 1], [1, 1], [1, 1]])
+
+
+def data_sheet():
+    header = [['编号', '名字'], ['id', 'name'], ['id', 'name']]
+    rows = [[1, 'Sword'], [2, 'Sword'], [3, 'Bow']]
+    return Sheet('Item', header, rows, [[2, 1], [2, 1], [2, 1]])
+
+
+def emit(tmp_path, sh, intern):
+    out = tmp_path / ('intern' if intern else 'plain')
+    out.mkdir()
+    [output] = xls2json.emitSheet(sh, str(out), intern=intern)
+    with open(output, 'rb') as f:
+        return f.read()
+
+
+def test_intern_keeps_config_sheet(tmp_path):
+    assert emit(tmp_path, config_sheet(), True) == emit(tmp_path, config_sheet(), False)
+
+
+def test_intern_pools_data_sheet(tmp_path):
+    text = emit(tmp_path, data_sheet(), True).decode('utf-8')
+    assert '"pool"' in text and text.count('"Sword"') == 1
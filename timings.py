@@ -0,0 +1,91 @@
+import cProfile
+import time
+from functools import wraps
+
+# --timings / --profile: 统计每个文件和每个阶段的耗时, 找出拖慢导出的表
+# 通过替换模块里的函数来计时, 不开启时没有任何额外开销
+
+
+class Timings:
+    def __init__(self):
+        self.phases = {}  # 阶段 -> 秒, 不含嵌套在里面的其他阶段
+        self.files = {}  # 文件 -> [秒, 行数, {阶段: 秒}]
+        self.current = None
+        self.stack = []  # 正在计时的阶段里, 嵌套阶段已经用掉的时间
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        if self.current is not None:
+            phases = self.files[self.current][2]
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    def wrap(self, func, phase, rows=None):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            self.stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+                self.add(phase, elapsed - nested)
+            if rows is not None and self.current is not None:
+                self.files[self.current][1] += rows(result, args)
+            return result
+        return timed
+
+    def wrap_file(self, func, key=str):
+        """func 的第一个参数是正在处理的文件, key 把它转成报告里的文件名"""
+        @wraps(func)
+        def timed(file, *args, **kwargs):
+            self.current = key(file)
+            entry = self.files.setdefault(self.current, [0.0, 0, {}])
+            start = time.perf_counter()
+            try:
+                return func(file, *args, **kwargs)
+            finally:
+                entry[0] += time.perf_counter() - start
+                self.current = None
+        return timed
+
+    def instrument(self, module, name, phase, rows=None):
+        setattr(module, name, self.wrap(getattr(module, name), phase, rows))
+
+    def report(self, top=10):
+        total = sum(f[0] for f in self.files.values())
+        rows = sum(f[1] for f in self.files.values())
+        lines = ['耗时统计(秒, 各阶段不含嵌套在其中的阶段):']
+        lines.append('  ' + '  '.join(f'{k} {v:.3f}' for k, v in sorted(self.phases.items(), key=lambda kv: -kv[1])))
+        rate = f', {rows / total:.0f} 行/秒' if total > 0 and rows else ''
+        lines.append(f'  共 {len(self.files)} 个文件, {total:.3f} 秒, {rows} 行{rate}')
+        if self.files:
+            lines.append(f'最慢的 {min(top, len(self.files))} 个文件:')
+            slowest = sorted(self.files.items(), key=lambda kv: -kv[1][0])[:top]
+            for name, (seconds, nrows, phases) in slowest:
+                detail = ', '.join(f'{k} {v:.3f}' for k, v in sorted(phases.items(), key=lambda kv: -kv[1]))
+                rate = f' {nrows / seconds:.0f} 行/秒' if seconds > 0 and nrows else ''
+                lines.append(f'  {seconds:8.3f}s {nrows:8d} 行{rate}  {name}  ({detail})')
+        return '\n'.join(lines)
+
+
+def run(func, args, timings=None, profile='', top=10):
+    """执行 func(*args); profile 非空时把 cProfile 结果保存到这个文件"""
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        return func(*args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            print('cProfile 结果已保存到:', profile)
+        if timings is not None:
+            print(timings.report(top))
+
+
+def sheet_rows(sheets, args):
+    return sum(len(sh.rows) for sh in sheets)
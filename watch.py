@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+# --watch: 常驻进程, 工作簿保存后只重新导出变化的文件
+# 装了 watchdog 时用文件系统事件(inotify 等)唤醒, 否则定时轮询; 两种方式都用文件快照判断是否真的有变化
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+def snapshot(root_dir, pattern='**/*.xlsm'):
+    """{路径: (大小, 修改时间)}, 与导出时一样忽略 ~$ 开头的临时文件"""
+    state = {}
+    for f in Path(root_dir).glob(pattern):
+        if f.name.find("~$") != -1:
+            continue
+        try:
+            st = os.stat(f)
+        except OSError:
+            continue  # 扫描过程中被删掉了
+        state[str(f)] = (st.st_size, st.st_mtime_ns)
+    return state
+
+
+def settle(root_dir, pattern, state, debounce):
+    """等到 debounce 秒内没有新的变化, 一次保存产生的多次写入只触发一次导出"""
+    while True:
+        time.sleep(debounce)
+        current = snapshot(root_dir, pattern)
+        if current == state:
+            return state
+        state = current
+
+
+class Wake(FileSystemEventHandler):
+    def __init__(self, event):
+        super().__init__()
+        self.event = event
+
+    def on_any_event(self, event):
+        self.event.set()
+
+
+def watch(rebuild, root_dir, pattern='**/*.xlsm', debounce=0.3, interval=0.3):
+    """
+    先调用一次 rebuild, 之后每批变化调用一次, Ctrl+C 退出.
+    rebuild 应当是增量导出: 没有变化的工作簿由清单跳过, 进程里的模块和已经加载的结构保持不变
+    """
+    wake = threading.Event()
+    observer = None
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(Wake(wake), str(root_dir), recursive=True)
+        observer.start()
+    print('监视目录:', root_dir, '(文件系统事件)' if observer is not None else '(轮询)', 'Ctrl+C 退出')
+    state = None
+    try:
+        while True:
+            current = snapshot(root_dir, pattern)
+            if current != state:
+                current = settle(root_dir, pattern, current, debounce)
+                if state is not None:
+                    changed = sorted(f for f in set(state) | set(current) if state.get(f) != current.get(f))
+                    print('变化的文件:', ', '.join(os.path.basename(f) for f in changed))
+                start = time.perf_counter()
+                try:
+                    rebuild()
+                except Exception as e:  # 表格写错或者还没保存完, 下次保存时会再导出
+                    print('导出失败:', e)
+                else:
+                    print('导出完成, 耗时 %.3f 秒' % (time.perf_counter() - start))
+                state = current
+            if observer is not None:
+                wake.wait(5.0)  # 偶尔也检查一次, 以防漏掉事件
+                wake.clear()
+            else:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
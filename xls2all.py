@@ -0,0 +1,214 @@
+from pathlib import Path
+import sys, getopt
+from functools import partial
+import pool
+from manifest import Manifest
+from schema import struct_to_dict, struct_from_dict
+from sheet import load_sheets, SheetError
+from timings import Timings, run, sheet_rows
+from watch import watch
+from sheetcache import SheetCache
+import xls2bin
+import xls2json
+import xls2lua
+import xls2struct
+
+# 每个工作簿只打开和解析一次, 同时导出 json, lua, 二进制表和 go 结构体
+
+# 逐个 sheet 写文件的导出器: 名字 -> 模块(提供 VERSION 和 emitSheet(sh, store_dir))
+EMITTERS = {
+    'xls2json': xls2json,
+    'xls2lua': xls2lua,
+    'xls2bin': xls2bin,
+}
+
+
+def exportWorkbook(job, cache=None, sheets='', options=None):
+    """options: 导出器名字 -> 传给它的 emitSheet 的额外参数"""
+    json_file, stale, go = job
+    workbook = load_sheets(json_file, cache, sheets)
+    options = options or {}
+    # 每个导出器的产出是工作簿里所有选中的 sheet 的文件
+    outputs = [[o for sh in workbook for o in EMITTERS[name].emitSheet(sh, store_dir, **options.get(name, {}))]
+               for name, store_dir in stale]
+    roots = [xls2struct.emitSheet(sh) for sh in workbook] if go else []
+    return outputs, [root for root in roots if root is not None]
+
+
+def parseJson(root_dir='./xls', json_dir='', lua_dir='', go_dir='', incremental=False, jobs=1, bin_dir='', codec=False, tables=False, cache=None,
+              sheets='', lazy=False, chunk=0, intern=False, diff=False):
+    path = Path(root_dir)
+    targets = []
+    selected = ' sheets=' + sheets if sheets else ''
+    for name, store_dir in (('xls2json', json_dir), ('xls2lua', lua_dir), ('xls2bin', bin_dir)):
+        if store_dir:
+            if name == 'xls2lua':
+                version = xls2lua.settings(sheets, lazy, chunk, intern, diff)
+            elif name == 'xls2json':
+                version = xls2json.settings(sheets, intern, diff)
+            else:
+                version = EMITTERS[name].VERSION + selected
+            manifest = Manifest(root_dir, store_dir, name, version) if incremental else None
+            targets.append((name, store_dir, manifest))
+    go_manifest = None
+    if go_dir and incremental:
+        go_manifest = Manifest(root_dir, go_dir, 'xls2struct', xls2struct.VERSION + (' bin' if bin_dir else '') + (' codec' if codec else '') +
+                                 (' tables' if tables else '') + selected)
+
+    # 忽略文件打开时的临时文件, 排序保证生成的类型名与顺序不随文件系统变化
+    all_json_file = sorted(f for f in path.glob('**/*.xlsm') if f.name.find("~$") == -1)
+    dirty = go_manifest is None
+    for name, store_dir, manifest in targets:
+        if manifest is not None:
+            manifest.prune(all_json_file)
+    if go_manifest is not None:
+        dirty = len(go_manifest.prune(all_json_file)) > 0
+
+    # 同时导出二进制表时, go 目录里还会生成它的读取代码
+    go_outputs = [go_dir + '/' + 'xls.go'] + ([go_dir + '/' + 'xlsbin.go'] if bin_dir else []) + \
+                 ([go_dir + '/' + 'xls_codec.go'] if codec else []) + \
+                 ([go_dir + '/' + 'xls_tables.go'] if tables else [])
+    roots = {}
+    jobs_list = []
+    for json_file in all_json_file:
+        stale = [t for t in targets if t[2] is None or not t[2].is_fresh(json_file)]
+        go_stale = bool(go_dir) and (go_manifest is None or not go_manifest.is_fresh(json_file))
+        if go_dir and not go_stale:
+            roots[json_file] = [struct_from_dict(s) for s in go_manifest.get(json_file, 'structs', [])]
+        if stale or go_stale:
+            jobs_list.append((json_file, stale, go_stale))
+
+    options = {'xls2json': {'intern': intern, 'diff': diff}, 'xls2lua': {'lazy': lazy, 'chunk': chunk, 'intern': intern, 'diff': diff}}
+    work = [(json_file, [(t[0], t[1]) for t in stale], go_stale) for json_file, stale, go_stale in jobs_list]
+    for (json_file, stale, go_stale), (outputs, file_roots) in zip(jobs_list, pool.run(partial(exportWorkbook, cache=cache, sheets=sheets, options=options), work, jobs)):
+        for (name, store_dir, manifest), o in zip(stale, outputs):
+            if manifest is not None:
+                manifest.update(json_file, o)
+        if go_stale:
+            roots[json_file] = file_roots
+            dirty = True
+            if go_manifest is not None:
+                go_manifest.update(json_file, go_outputs, structs=[struct_to_dict(root) for root in file_roots])
+
+    if go_dir and dirty:
+        # 按文件顺序生成, 与各进程完成的先后无关
+        xls2struct.writeStructs(go_dir, [root for f in all_json_file for root in roots[f]], bool(bin_dir), codec, tables)
+    for manifest in [t[2] for t in targets] + [go_manifest]:
+        if manifest is not None:
+            manifest.save()
+
+
+def instrument(timings):
+    """--timings: 替换各阶段的函数来计时, 各阶段不含嵌套在其中的阶段"""
+    module = sys.modules[__name__]
+    timings.instrument(module, 'load_sheets', 'read', sheet_rows)
+    for emitter in (xls2json, xls2struct):
+        timings.instrument(emitter, 'parseRow', 'parse')
+    timings.instrument(xls2json, 'parseValue', 'parseValue')
+    timings.instrument(xls2lua, 'parseValue', 'parseValue')
+    timings.instrument(xls2bin, 'parseValue', 'parseValue')
+    timings.instrument(xls2json, 'emitSheet', 'json')
+    timings.instrument(xls2lua, 'emitSheet', 'lua')
+    timings.instrument(xls2bin, 'emitSheet', 'bin')
+    timings.instrument(xls2struct, 'emitSheet', 'infer')
+    timings.instrument(xls2struct, 'build_struct', 'build')
+    timings.instrument(xls2struct, 'writeStructs', 'write')
+    module.exportWorkbook = timings.wrap_file(module.exportWorkbook, key=lambda job: str(job[0]))
+
+
+def main(argv):
+    usage = ('xls2all.py -i <inputfile> [-j <jsondir>] [-l <luadir>] [-b <bindir>] [-g <godir>] [--codec] [--tables] [--incremental] [--watch] [--sheets <prefixes>] [--lazy] [--chunk N] [--intern] [--diff] [--cache <dir>] [--cache-size MB] [--jobs N]'
+             ' [--timings] [--top N] [--profile <file>]')
+    inputfile = ''
+    json_dir = ''
+    lua_dir = ''
+    go_dir = ''
+    bin_dir = ''
+    codec = False
+    tables = False
+    incremental = False
+    watching = False
+    sheets = ''
+    lazy = False
+    chunk = 0
+    intern = False
+    diff = False
+    cache_dir = ''
+    cache_size = 512
+    jobs = 1
+    timings = None
+    profile = ''
+    top = 10
+    try:
+        opts, args = getopt.getopt(argv, "hi:j:l:b:g:", ["ifile=", "json=", "lua=", "bin=", "go=", "codec", "tables", "incremental", "watch", "sheets=", "lazy", "chunk=", "intern", "diff", "cache=", "cache-size=", "jobs=", "timings", "top=", "profile="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputfile = arg
+        elif opt in ("-j", "--json"):
+            json_dir = arg
+        elif opt in ("-l", "--lua"):
+            lua_dir = arg
+        elif opt in ("-b", "--bin"):
+            bin_dir = arg
+        elif opt in ("-g", "--go"):
+            go_dir = arg
+        elif opt == "--codec":
+            codec = True
+        elif opt == "--tables":
+            tables = True
+        elif opt == "--incremental":
+            incremental = True
+        elif opt == "--watch":
+            watching = True
+        elif opt == "--sheets":
+            sheets = arg
+        elif opt == "--lazy":
+            lazy = True
+        elif opt == "--chunk":
+            lazy = True  # 分块只用于 --lazy 格式
+            chunk = int(arg)
+        elif opt == "--intern":
+            intern = True
+        elif opt == "--diff":
+            diff = True
+        elif opt == "--cache":
+            cache_dir = arg
+        elif opt == "--cache-size":
+            cache_size = int(arg)
+        elif opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--timings":
+            timings = Timings()
+        elif opt == "--top":
+            top = int(arg)
+        elif opt == "--profile":
+            profile = arg
+    if timings is not None:
+        instrument(timings)
+    if timings is not None or profile:
+        jobs = 1  # 计时和 cProfile 只能统计当前进程
+
+    print('输入的文件为:', inputfile)
+    print('输出的目录为:', json_dir, lua_dir, bin_dir, go_dir)
+    # 解析结果的磁盘缓存, 内容没有变化的工作簿不再重新解析
+    cache = SheetCache(cache_dir, cache_size << 20) if cache_dir else None
+    if watching:
+        # 常驻进程总是增量导出, 每次保存只重新生成变化的工作簿
+        watch(lambda: parseJson(inputfile, json_dir, lua_dir, go_dir, True, jobs, bin_dir, codec, tables, cache, sheets, lazy, chunk, intern, diff), inputfile)
+    else:
+        try:
+            run(parseJson, (inputfile, json_dir, lua_dir, go_dir, incremental, jobs, bin_dir, codec, tables, cache, sheets, lazy, chunk, intern, diff), timings, profile, top)
+        except SheetError as e:
+            print(e)  # 表格内容有误, 已经列出出错的行和列
+            sys.exit(1)
+    print('恭喜生成完成!!')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
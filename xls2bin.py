@@ -0,0 +1,509 @@
+from pathlib import Path
+import sys, getopt
+import json
+import struct
+from array import array
+from functools import partial
+import pool
+from manifest import Manifest
+from output import open_output
+from sheet import load_sheets, row_id, SheetError
+from timings import Timings, run, sheet_rows
+from watch import watch
+from sheetcache import SheetCache
+from xls2json import parseValue
+
+VERSION = '1'
+
+# 二进制表: 按列存放, 所有字符串放进一个字符串表, id 排好序作为索引, 服务器可以直接 mmap 后按 id 二分查找
+# 小端序, 布局:
+#   'XLSB' | 格式版本 u32 | 行数 u32 | 列数 u32 | 字符串数 u32 | 配置项数 u32
+#   字符串表: 每个字符串的结束位置 u32 * 字符串数, 然后是 utf-8 内容
+#   列定义: (列名 u32 字符串下标, 类型 u32) * 列数
+#   id: i64 * 行数, 从小到大
+#   每一列: 有值的位图 (行数+7)/8 字节, 然后是 行数 * 宽度 的值
+#   配置行: (key u32, 值 u32) * 配置项数, 值是 json 文本的字符串下标
+MAGIC = b'XLSB'
+FORMAT = 1
+
+INT = 1  # i64
+FLOAT = 2  # f64
+STRING = 3  # u32 字符串下标
+BOOL = 4  # u8
+JSON = 5  # u32 字符串下标, 内容是 json 文本; 数组、对象和类型混杂的列
+TYPECODES = {INT: 'q', FLOAT: 'd', STRING: 'I', BOOL: 'B', JSON: 'I'}
+
+encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+class StringTable:
+    def __init__(self):
+        self.index = {}
+
+    def add(self, s):
+        return self.index.setdefault(s, len(self.index))
+
+    def pack(self):
+        blobs = [s.encode('utf-8') for s in self.index]
+        ends = array('I')
+        end = 0
+        for b in blobs:
+            end += len(b)
+            ends.append(end)
+        return little(ends) + b''.join(blobs)
+
+
+def little(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def column_kind(values):
+    """一列里所有有值的单元格共用一个类型, 混杂时按 json 文本存放"""
+    kinds = set(type(v) for v in values if v is not None)
+    if kinds == {bool}:
+        return BOOL
+    if kinds == {int} and all(-1 << 63 <= v < 1 << 63 for v in values if v is not None):
+        return INT
+    if kinds and kinds <= {int, float}:
+        return FLOAT
+    if kinds == {str}:
+        return STRING
+    return JSON
+
+
+def pack_column(values, kind, strings):
+    present = bytearray((len(values) + 7) // 8)
+    packed = array(TYPECODES[kind])
+    for i, v in enumerate(values):
+        if v is None:
+            packed.append(0)
+            continue
+        present[i >> 3] |= 1 << (i & 7)
+        if kind == STRING:
+            v = strings.add(v)
+        elif kind == JSON:
+            v = strings.add(encoder.encode(v))
+        packed.append(v)
+    return bytes(present) + little(packed)
+
+
+def emitSheet(sh, store_dir):
+    """导出一个 sheet 页, 返回生成的文件列表"""
+    outputs = []
+    title = sh.title(2)
+    if len(title) == 0 or len(str(title[0]).strip()) == 0:
+        return outputs
+
+    # 与 xls2json 一致: 相同 id 保留最后一行, 非数字 id 的行是配置
+    data = {}
+    config = []
+    for i, rowvalue in enumerate(sh.rows):
+        id = row_id(rowvalue[0])
+        if id is not None:
+            data[id] = i
+        elif len(rowvalue[0].strip()) > 0:
+            config.append((rowvalue[0], parseValue(rowvalue[1]) if len(rowvalue) > 1 else ''))
+    ids = sorted(data)
+    rows = [data[id] for id in ids]
+
+    strings = StringTable()
+    columns = []
+    body = []
+    for col in range(1, len(title)):
+        key = str(title[col])
+        if key == 'id' or len(key.strip()) == 0:
+            continue
+        values = [None if isinstance(v, str) and len(v.strip()) == 0 else parseValue(v) for v in sh.column(col, rows)]
+        kind = column_kind(values)
+        columns.extend((strings.add(key), kind))
+        body.append(pack_column(values, kind, strings))
+    pairs = array('I')
+    for key, value in config:
+        pairs.extend((strings.add(key), strings.add(encoder.encode(value))))
+
+    output = store_dir + '/' + sh.name + 'Data.bin'
+    outputs.append(output)
+    with open_output(output, binary=True) as f:
+        f.write(MAGIC + struct.pack('<5I', FORMAT, len(rows), len(columns) // 2, len(strings.index), len(config)))
+        f.write(strings.pack())
+        f.write(little(array('I', columns)))
+        f.write(little(array('q', ids)))
+        for b in body:
+            f.write(b)
+        f.write(little(pairs))
+    return outputs
+
+
+# 与 xls2struct 生成的结构体放在同一个包里的读取代码
+GO_READER = '''import (
+	"encoding/binary"
+	"encoding/json"
+	"errors"
+	"math"
+	"os"
+	"sort"
+	"strconv"
+)
+
+// Table 是 xls2bin.py 导出的二进制表, data 可以来自 os.ReadFile 或 mmap, 打开时只解码字符串表
+type Table struct {
+	nrows   int
+	strings []string
+	columns []binColumn
+	byName  map[string]int
+	ids     []byte
+	config  map[string]string
+}
+
+type binColumn struct {
+	kind    uint32
+	present []byte
+	values  []byte
+}
+
+const (
+	binInt    = 1
+	binFloat  = 2
+	binString = 3
+	binBool   = 4
+	binJSON   = 5
+)
+
+var binWidth = map[uint32]int{binInt: 8, binFloat: 8, binString: 4, binBool: 1, binJSON: 4}
+
+var ErrBadTable = errors.New("xls: bad binary table")
+
+var binOrder = binary.LittleEndian
+
+func LoadTable(path string) (*Table, error) {
+	data, err := os.ReadFile(path)
+	if err != nil {
+		return nil, err
+	}
+	return OpenTable(data)
+}
+
+func OpenTable(data []byte) (*Table, error) {
+	if len(data) < 24 || string(data[:4]) != "XLSB" || binOrder.Uint32(data[4:]) != 1 {
+		return nil, ErrBadTable
+	}
+	nrows := int(binOrder.Uint32(data[8:]))
+	ncols := int(binOrder.Uint32(data[12:]))
+	nstrings := int(binOrder.Uint32(data[16:]))
+	nconfig := int(binOrder.Uint32(data[20:]))
+	pos := 24
+	bad := false
+	take := func(n int) []byte {
+		if bad || n < 0 || n > len(data)-pos {
+			bad = true
+			return nil
+		}
+		b := data[pos : pos+n : pos+n]
+		pos += n
+		return b
+	}
+
+	ends := take(4 * nstrings)
+	size := 0
+	if !bad && nstrings > 0 {
+		size = int(binOrder.Uint32(ends[4*(nstrings-1):]))
+	}
+	blob := take(size)
+	if bad {
+		return nil, ErrBadTable
+	}
+	t := &Table{nrows: nrows, strings: make([]string, nstrings), byName: map[string]int{}, config: map[string]string{}}
+	start := 0
+	for i := range t.strings {
+		end := int(binOrder.Uint32(ends[4*i:]))
+		if end < start || end > size {
+			return nil, ErrBadTable
+		}
+		t.strings[i] = string(blob[start:end])
+		start = end
+	}
+
+	cols := take(8 * ncols)
+	t.ids = take(8 * nrows)
+	for i := 0; i < ncols && !bad; i++ {
+		name, kind := binOrder.Uint32(cols[8*i:]), binOrder.Uint32(cols[8*i+4:])
+		width, ok := binWidth[kind]
+		if !ok || int(name) >= nstrings {
+			return nil, ErrBadTable
+		}
+		c := binColumn{kind: kind, present: take((nrows + 7) / 8), values: take(width * nrows)}
+		if !bad && (kind == binString || kind == binJSON) {
+			for row := 0; row < nrows; row++ {
+				if int(binOrder.Uint32(c.values[4*row:])) >= nstrings {
+					return nil, ErrBadTable
+				}
+			}
+		}
+		t.byName[t.strings[name]] = i
+		t.columns = append(t.columns, c)
+	}
+	pairs := take(8 * nconfig)
+	if bad {
+		return nil, ErrBadTable
+	}
+	for i := 0; i < nconfig; i++ {
+		key, value := int(binOrder.Uint32(pairs[8*i:])), int(binOrder.Uint32(pairs[8*i+4:]))
+		if key >= nstrings || value >= nstrings {
+			return nil, ErrBadTable
+		}
+		t.config[t.strings[key]] = t.strings[value]
+	}
+	return t, nil
+}
+
+// Len 返回行数, 行按 id 从小到大排列
+func (t *Table) Len() int {
+	return t.nrows
+}
+
+func (t *Table) ID(row int) int {
+	return int(int64(binOrder.Uint64(t.ids[8*row:])))
+}
+
+// Find 二分查找 id 所在的行
+func (t *Table) Find(id int) (int, bool) {
+	row := sort.Search(t.nrows, func(i int) bool { return t.ID(i) >= id })
+	return row, row < t.nrows && t.ID(row) == id
+}
+
+// Col 返回列号, 没有这一列时返回 -1
+func (t *Table) Col(name string) int {
+	if i, ok := t.byName[name]; ok {
+		return i
+	}
+	return -1
+}
+
+// Has 表示这个单元格有没有值, 没有值时各个读取方法返回零值
+func (t *Table) Has(row, col int) bool {
+	return col >= 0 && t.columns[col].present[row>>3]&(1<<(row&7)) != 0
+}
+
+func (t *Table) Int(row, col int) int {
+	if !t.Has(row, col) {
+		return 0
+	}
+	c := &t.columns[col]
+	switch c.kind {
+	case binInt:
+		return int(int64(binOrder.Uint64(c.values[8*row:])))
+	case binFloat:
+		return int(math.Float64frombits(binOrder.Uint64(c.values[8*row:])))
+	case binBool:
+		return int(c.values[row])
+	}
+	return 0
+}
+
+func (t *Table) Float(row, col int) float64 {
+	if !t.Has(row, col) {
+		return 0
+	}
+	c := &t.columns[col]
+	if c.kind == binFloat {
+		return math.Float64frombits(binOrder.Uint64(c.values[8*row:]))
+	}
+	return float64(t.Int(row, col))
+}
+
+func (t *Table) Bool(row, col int) bool {
+	return t.Int(row, col) != 0
+}
+
+func (t *Table) Text(row, col int) string {
+	if !t.Has(row, col) {
+		return ""
+	}
+	c := &t.columns[col]
+	if c.kind == binString || c.kind == binJSON {
+		return t.strings[binOrder.Uint32(c.values[4*row:])]
+	}
+	return string(t.Raw(row, col))
+}
+
+// Raw 返回单元格的 json 文本
+func (t *Table) Raw(row, col int) []byte {
+	if !t.Has(row, col) {
+		return []byte("null")
+	}
+	c := &t.columns[col]
+	switch c.kind {
+	case binInt:
+		return strconv.AppendInt(nil, int64(t.Int(row, col)), 10)
+	case binFloat:
+		return strconv.AppendFloat(nil, t.Float(row, col), 'g', -1, 64)
+	case binBool:
+		return strconv.AppendBool(nil, t.Bool(row, col))
+	case binString:
+		b, _ := json.Marshal(t.Text(row, col))
+		return b
+	}
+	return []byte(t.Text(row, col))
+}
+
+// JSON 把单元格按 json 解码到 v, 用于数组、对象等字段
+func (t *Table) JSON(row, col int, v interface{}) error {
+	if !t.Has(row, col) {
+		return nil
+	}
+	return json.Unmarshal(t.Raw(row, col), v)
+}
+
+// Config 把配置表(非数字 id 的行)解码到 v
+func (t *Table) Config(v interface{}) error {
+	fields := make(map[string]json.RawMessage, len(t.config))
+	for k, s := range t.config {
+		fields[k] = json.RawMessage(s)
+	}
+	data, err := json.Marshal(fields)
+	if err != nil {
+		return err
+	}
+	return json.Unmarshal(data, v)
+}'''
+
+# go 类型 -> 读取方法, 其余类型按 json 文本解码
+GO_GETTERS = {
+    'int': 't.Int(row, %s)',
+    'float32': 'float32(t.Float(row, %s))',
+    'float64': 't.Float(row, %s)',
+    'string': 't.Text(row, %s)',
+    'bool': 't.Bool(row, %s)',
+}
+
+
+def create_reader_strings(roots):
+    """为每个顶层结构体生成按 id 读取一行的方法, roots 的名字已经由 create_package_strings 确定"""
+    strings = [GO_READER]
+    for root in roots:
+        lines = [f'// {root.name}At 解码第 row 行, 字段类型与数据不符时保留零值',
+                 f'func (t *Table) {root.name}At(row int) *{root.name} ' + '{',
+                 f'\tv := &{root.name}' + '{}']
+        for field in root.fields:
+            col = f't.Col({json.dumps(field.key, ensure_ascii=False)})'
+            getter = GO_GETTERS.get(field.type)
+            if getter is not None:
+                lines.append(f'\tv.{field.name} = {getter % col}')
+            else:
+                lines.append(f'\tt.JSON(row, {col}, &v.{field.name})')
+        lines += ['\treturn v', '}', '',
+                  f'// Get{root.name} 按 id 读取一行',
+                  f'func (t *Table) Get{root.name}(id int) (*{root.name}, bool) ' + '{',
+                  '\trow, ok := t.Find(id)',
+                  '\tif !ok {',
+                  '\t\treturn nil, false',
+                  '\t}',
+                  f'\treturn t.{root.name}At(row), true',
+                  '}']
+        strings.append('\n'.join(lines))
+    return strings
+
+
+def exportWorkbook(json_file, store_dir, cache=None, sheets=''):
+    # 一个工作簿里选中的所有 sheet 共用一次读取
+    return [output for sh in load_sheets(json_file, cache, sheets) for output in emitSheet(sh, store_dir)]
+
+
+def parseJson(root_dir='./xls', store_dir='"./bin"', incremental=False, jobs=1, cache=None, sheets=''):
+    path = Path(root_dir)
+    # 增量模式下跳过没有变化的工作簿, 并删除源文件已不存在的产出
+    settings = VERSION + (' sheets=' + sheets if sheets else '')
+    manifest = Manifest(root_dir, store_dir, 'xls2bin', settings) if incremental else None
+
+    # 忽略文件打开时的临时文件
+    all_json_file = [f for f in path.glob('**/*.xlsm') if f.name.find("~$") == -1]
+    if manifest is not None:
+        manifest.prune(all_json_file)
+        all_json_file = [f for f in all_json_file if not manifest.is_fresh(f)]
+    all_outputs = pool.run(partial(exportWorkbook, store_dir=store_dir, cache=cache, sheets=sheets), all_json_file, jobs)
+    if manifest is not None:
+        for json_file, outputs in zip(all_json_file, all_outputs):
+            manifest.update(json_file, outputs)
+        manifest.save()
+
+
+def instrument(timings):
+    """--timings: 替换各阶段的函数来计时, 各阶段不含嵌套在其中的阶段"""
+    module = sys.modules[__name__]
+    timings.instrument(module, 'load_sheets', 'read', sheet_rows)
+    timings.instrument(module, 'parseValue', 'parseValue')
+    timings.instrument(module, 'pack_column', 'pack')
+    timings.instrument(module, 'emitSheet', 'write')
+    module.exportWorkbook = timings.wrap_file(module.exportWorkbook)
+
+
+def main(argv):
+    usage = ('xls2bin.py -i <inputfile> -o <outputfile> [--incremental] [--watch] [--sheets <prefixes>] [--cache <dir>] [--cache-size MB] [--jobs N]'
+             ' [--timings] [--top N] [--profile <file>]')
+    inputfile = ''
+    outputfile = ''
+    incremental = False
+    watching = False
+    sheets = ''
+    cache_dir = ''
+    cache_size = 512
+    jobs = 1
+    timings = None
+    profile = ''
+    top = 10
+    try:
+        opts, args = getopt.getopt(argv, "hi:o:", ["ifile=", "ofile=", "incremental", "watch", "sheets=", "cache=", "cache-size=", "jobs=", "timings", "top=", "profile="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputfile = arg
+        elif opt in ("-o", "--ofile"):
+            outputfile = arg
+        elif opt == "--incremental":
+            incremental = True
+        elif opt == "--watch":
+            watching = True
+        elif opt == "--sheets":
+            sheets = arg
+        elif opt == "--cache":
+            cache_dir = arg
+        elif opt == "--cache-size":
+            cache_size = int(arg)
+        elif opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--timings":
+            timings = Timings()
+        elif opt == "--top":
+            top = int(arg)
+        elif opt == "--profile":
+            profile = arg
+    if timings is not None:
+        instrument(timings)
+    if timings is not None or profile:
+        jobs = 1  # 计时和 cProfile 只能统计当前进程
+
+    print('输入的文件为:', inputfile)
+    print('输出的文件为:', outputfile)
+    # 解析结果的磁盘缓存, 内容没有变化的工作簿不再重新解析
+    cache = SheetCache(cache_dir, cache_size << 20) if cache_dir else None
+    if watching:
+        # 常驻进程总是增量导出, 每次保存只重新生成变化的工作簿
+        watch(lambda: parseJson(inputfile, outputfile, True, jobs, cache, sheets), inputfile)
+    else:
+        try:
+            run(parseJson, (inputfile, outputfile, incremental, jobs, cache, sheets), timings, profile, top)
+        except SheetError as e:
+            print(e)  # 表格内容有误, 已经列出出错的行和列
+            sys.exit(1)
+    print('恭喜生成完成!!')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,104 +1,297 @@
 from pathlib import Path
 import json
-import xlrd
-import codecs
 import sys, getopt
+from functools import partial
+import pool
+from manifest import Manifest
+from output import open_output
+from sheet import load_sheets, row_id, SheetError
+from delta import snapshot_path, load_snapshot, save_snapshot, diff_rows
+from timings import Timings, run, sheet_rows
+from watch import watch
+from sheetcache import SheetCache
 
-def is_number(s):
+VERSION = '3'
+
+
+def parseValue(value):
+    """单元格的值转成 python 对象, 由 json 编码器负责转义"""
+    if not isinstance(value, str):
+        return value  # 读表时已按单元格类型转好, 整数原样输出, 小数用最短的可还原表示
+    if len(value) > 1 and value[0] == '[' and value[-1] == ']':
+        text = value.replace('=', ':', -1)
+    elif len(value) > 1 and value[0] == '{' and value[-1] == '}':
+        text = value.replace('{', '[', -1).replace('}', ']', -1)
+    else:
+        return value
     try:
-        float(s)  # 如果能转换float，说明是个数字
-        return True
+        return json.loads(text)
     except ValueError:
-        pass  # 占位符
+        return value  # 写错的数组按字符串导出, 保证输出的 json 合法
 
-    try:
-        import unicodedata  # 引入Unicodedata模块
-        unicodedata.numeric(s)  # 如果能转成numeric，说明是个数字
-        return True
-    except (TypeError, ValueError):
-        pass
 
-    return False
+encoder = json.JSONEncoder(ensure_ascii=False, separators=(', ', ' : '))
 
 
-def parseValue(value):
-    if is_number(value):
-        return ('%f' % value).rstrip('0').rstrip('.')
-    else:
-        if len(value) > 1 and value[0] == '[' and value[-1] == ']':
-            return value.replace('=', ':',-1)
-        elif len(value) > 1 and value[0] == '{' and value[-1] == '}':
-            return value.replace('{', '[',-1).replace('}', ']',-1)
+def parseRow(title, rowvalue):
+    """返回 (key, value), 空行返回 None"""
+    id = row_id(rowvalue[0])
+    if id is None:
+        if len(rowvalue[0].strip()) == 0:
+            return None
+        return rowvalue[0], parseValue(rowvalue[1]) if len(rowvalue) > 1 else ''
+
+    single = {}
+    for colnum in range(1, min(len(rowvalue), len(title))):
+        value = rowvalue[colnum]
+        if isinstance(value, str) and len(value.strip()) == 0:
+            continue
+        key = str(title[colnum])
+        # 忽略id列和空行
+        if key == 'id' or len(key.strip()) == 0:
+            continue
+        single[key] = parseValue(value)
+    return str(id), single
+
+
+def writeSheet(sh, f):
+    """把 sheet 页写成 json, f 是文本流; 逐行编码写出, 不在内存里拼接整张表"""
+    title = sh.title(2)
+    f.write("\n{\n    ")
+    sep = ''
+    for rowvalue in sh.rows:
+        entry = parseRow(title, rowvalue)
+        if entry is None:
+            continue
+        f.write(sep)
+        f.write(encoder.encode(entry[0]))
+        f.write(' : ')
+        for chunk in encoder.iterencode(entry[1]):
+            f.write(chunk)
+        sep = '\n    ,'
+    f.write("\n}")
+
+
+def hasConfig(sh):
+    """有 key/value 形式的配置行"""
+    return any(row_id(row[0]) is None and len(row[0].strip()) > 0 for row in sh.rows)
+
+
+def writeInterned(sh, f):
+    """
+    --intern: 只有字符串、数组和对象的列, 值放进常量池, 相同的值只写一次, 行里保存池里的下标(从 1 开始).
+    格式为 {"pool" : [值...], "refs" : [保存下标的列], "rows" : {id : 行}}; 配置表不用这个格式
+    """
+    title = sh.title(2)
+    entries = [entry for entry in (parseRow(title, rowvalue) for rowvalue in sh.rows) if entry is not None]
+    columns = {}
+    for _, value in entries:
+        if isinstance(value, dict):
+            for k, v in value.items():
+                columns.setdefault(k, []).append(v)
+    refs = [k for k, values in columns.items() if all(isinstance(v, (str, list, dict)) for v in values)]
+    consts = {}  # 编码后的值 -> 下标
+    refset = set(refs)
+    for _, value in entries:
+        if isinstance(value, dict):
+            for k, v in value.items():
+                if k in refset:
+                    value[k] = consts.setdefault(encoder.encode(v), len(consts) + 1)
+    f.write('\n{\n    "pool" : [')
+    sep = '\n        '
+    for text in consts:
+        f.write(sep)
+        f.write(text)
+        sep = '\n        ,'
+    f.write('\n    ]\n    ,"refs" : ')
+    f.write(encoder.encode(refs))
+    f.write('\n    ,"rows" : {')
+    sep = '\n        '
+    for key, value in entries:
+        f.write(sep)
+        f.write(encoder.encode(key))
+        f.write(' : ')
+        f.write(encoder.encode(value))
+        sep = '\n        ,'
+    f.write('\n    }\n}')
+
+
+def dataRows(sh):
+    """--diff 的快照: {id: {字段: 值的 json 文本}}, 有配置行时返回 None"""
+    title = sh.title(2)
+    rows = {}
+    for rowvalue in sh.rows:
+        entry = parseRow(title, rowvalue)
+        if entry is None:
+            continue
+        if not isinstance(entry[1], dict):
+            return None
+        rows[entry[0]] = {key: encoder.encode(value) for key, value in entry[1].items()}
+    return rows
+
+
+def rowText(row):
+    return '{' + ', '.join(encoder.encode(key) + ' : ' + text for key, text in row.items()) + '}'
+
+
+def writePatch(sh, output):
+    """
+    --diff: 与上一次导出的快照比较, 在 output 旁边写 <Sheet>Data.json.patch, 返回生成的文件列表.
+    格式为 {"removed" : [id], "added" : {id : 行}, "changed" : {id : {字段 : 新值}}, "cleared" : {id : [清空的字段]}};
+    第一次导出(没有快照)和有配置行的表不生成补丁
+    """
+    rows = dataRows(sh)
+    if rows is None:
+        return []
+    path = snapshot_path(output)
+    old = load_snapshot(path)
+    outputs = [path]
+    if old is not None:
+        removed, added, changed, cleared = diff_rows(old, rows)
+        outputs.append(output + '.patch')
+        with open_output(output + '.patch') as f:
+            f.write('\n{\n    "removed" : ')
+            f.write(encoder.encode(removed))
+            for name, entries in (('added', added), ('changed', changed)):
+                f.write('\n    ,"%s" : {' % name)
+                sep = '\n        '
+                for id, row in entries.items():
+                    f.write(sep + encoder.encode(id) + ' : ' + rowText(row))
+                    sep = '\n        ,'
+                f.write('\n    }' if entries else '}')
+            f.write('\n    ,"cleared" : ')
+            f.write(encoder.encode(cleared))
+            f.write('\n}')
+    save_snapshot(path, rows)
+    return outputs
+
+
+def emitSheet(sh, store_dir, intern=False, diff=False):
+    """导出一个 sheet 页, 返回生成的文件列表"""
+    outputs = []
+    title = sh.title(2)
+
+    if len(title) == 0 or len(str(title[0]).strip()) == 0:
+        return outputs
+    # sheet页名+ Data.json 作为生成文件的名字
+    output = store_dir + '/' + sh.name + 'Data.json'
+    outputs.append(output)
+    with open_output(output) as f:
+        if intern and not hasConfig(sh):
+            writeInterned(sh, f)
         else:
-            return '"%s"' % value
+            writeSheet(sh, f)  # 配置表仍按原来的格式导出
+    if diff:
+        outputs += writePatch(sh, output)
+    return outputs
 
-def parseJson(root_dir='./xls', store_dir='"./json"'):
+
+def exportWorkbook(json_file, store_dir, cache=None, sheets='', intern=False, diff=False):
+    # 一个工作簿里选中的所有 sheet 共用一次读取
+    return [output for sh in load_sheets(json_file, cache, sheets) for output in emitSheet(sh, store_dir, intern, diff)]
+
+
+def settings(sheets='', intern=False, diff=False):
+    """清单里记录的导出参数, xls2all 也用它"""
+    return VERSION + (' sheets=' + sheets if sheets else '') + (' intern' if intern else '') + (' diff' if diff else '')
+
+
+def parseJson(root_dir='./xls', store_dir='"./json"', incremental=False, jobs=1, cache=None, sheets='', intern=False, diff=False):
     path = Path(root_dir)
+    # 增量模式下跳过没有变化的工作簿, 并删除源文件已不存在的产出
+    manifest = Manifest(root_dir, store_dir, 'xls2json', settings(sheets, intern, diff)) if incremental else None
+
+    # 忽略文件打开时的临时文件
+    all_json_file = [f for f in path.glob('**/*.xlsm') if f.name.find("~$") == -1]
+    if manifest is not None:
+        manifest.prune(all_json_file)
+        all_json_file = [f for f in all_json_file if not manifest.is_fresh(f)]
+    all_outputs = pool.run(partial(exportWorkbook, store_dir=store_dir, cache=cache, sheets=sheets, intern=intern, diff=diff), all_json_file, jobs)
+    if manifest is not None:
+        for json_file, outputs in zip(all_json_file, all_outputs):
+            manifest.update(json_file, outputs)
+        manifest.save()
 
-    all_json_file = list(path.glob('**/*.xlsm'))
-    for json_file in all_json_file:
-        if json_file.name.find("~$") != -1:  # 忽略文件打开时的临时文件
-            continue
-        with xlrd.open_workbook(json_file) as wb:
-            dic = []
-            sh = wb.sheet_by_index(0)  # sheet页
-            title = sh.row_values(2)
-
-            if len(str(title[0]).strip()) == 0:
-                continue
-            for rownum in range(3, sh.nrows):
-                rowvalue = sh.row_values(rownum)
-                single = ''
-
-                id = rowvalue[0]
-                if is_number(id):
-                    single += '"%s" : { ' % int(id)
-                else:
-                    if len(str(id).strip()) == 0:
-                        continue
-                    single += '"%s" : %s' % (id, parseValue(rowvalue[1]))
-                    dic.append(single)
-                    continue
-
-                for colnum in range(1, len(rowvalue)):
-                    value = rowvalue[colnum]
-                    if len(str(value).strip()) == 0:
-                        continue
-                    key = str(title[colnum])
-                    # 忽略id列和空行
-                    if key == 'id' or len(key.strip()) == 0:
-                        continue
-                    single += '"%s" : %s, ' % (key, parseValue(value))
-                single = single[:-2]
-                single += '}'
-                dic.append(single)
-            # sheet页名+ Data.json 作为生成文件的名字
-            with codecs.open(store_dir + '/' + sh.name + 'Data.json', "w", "utf-8") as f:
-                j = "\n{\n    "
-                j += '\n    ,'.join(dic)
-                f.write(j + "\n}")
+
+def instrument(timings):
+    """--timings: 替换各阶段的函数来计时, 各阶段不含嵌套在其中的阶段"""
+    module = sys.modules[__name__]
+    timings.instrument(module, 'load_sheets', 'read', sheet_rows)
+    timings.instrument(module, 'parseRow', 'parse')
+    timings.instrument(module, 'parseValue', 'parseValue')
+    timings.instrument(module, 'emitSheet', 'write')
+    module.exportWorkbook = timings.wrap_file(module.exportWorkbook)
 
 
 def main(argv):
+    usage = ('xls2json.py -i <inputfile> -o <outputfile> [--incremental] [--watch] [--sheets <prefixes>] [--intern] [--diff] [--cache <dir>] [--cache-size MB] [--jobs N]'
+             ' [--timings] [--top N] [--profile <file>]')
     inputfile = ''
     outputfile = ''
+    incremental = False
+    watching = False
+    sheets = ''
+    intern = False
+    diff = False
+    cache_dir = ''
+    cache_size = 512
+    jobs = 1
+    timings = None
+    profile = ''
+    top = 10
     try:
-        opts, args = getopt.getopt(argv, "hi:o:", ["ifile=", "ofile="])
+        opts, args = getopt.getopt(argv, "hi:o:", ["ifile=", "ofile=", "incremental", "watch", "sheets=", "intern", "diff", "cache=", "cache-size=", "jobs=", "timings", "top=", "profile="])
     except getopt.GetoptError:
-        print('xls2json.py -i <inputfile> -o <outputfile>')
+        print(usage)
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
-            print('xls2json.py -i <inputfile> -o <outputfile>')
+            print(usage)
             sys.exit()
         elif opt in ("-i", "--ifile"):
             inputfile = arg
         elif opt in ("-o", "--ofile"):
             outputfile = arg
+        elif opt == "--incremental":
+            incremental = True
+        elif opt == "--watch":
+            watching = True
+        elif opt == "--sheets":
+            sheets = arg
+        elif opt == "--intern":
+            intern = True
+        elif opt == "--diff":
+            diff = True
+        elif opt == "--cache":
+            cache_dir = arg
+        elif opt == "--cache-size":
+            cache_size = int(arg)
+        elif opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--timings":
+            timings = Timings()
+        elif opt == "--top":
+            top = int(arg)
+        elif opt == "--profile":
+            profile = arg
+    if timings is not None:
+        instrument(timings)
+    if timings is not None or profile:
+        jobs = 1  # 计时和 cProfile 只能统计当前进程
 
     print('输入的文件为:', inputfile)
     print('输出的文件为:', outputfile)
-    parseJson(inputfile, outputfile)
+    # 解析结果的磁盘缓存, 内容没有变化的工作簿不再重新解析
+    cache = SheetCache(cache_dir, cache_size << 20) if cache_dir else None
+    if watching:
+        # 常驻进程总是增量导出, 每次保存只重新生成变化的工作簿
+        watch(lambda: parseJson(inputfile, outputfile, True, jobs, cache, sheets, intern, diff), inputfile)
+    else:
+        try:
+            run(parseJson, (inputfile, outputfile, incremental, jobs, cache, sheets, intern, diff), timings, profile, top)
+        except SheetError as e:
+            print(e)  # 表格内容有误, 已经列出出错的行和列
+            sys.exit(1)
     print('恭喜生成完成!!')
 
 
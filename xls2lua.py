@@ -1,111 +1,455 @@
 from pathlib import Path
 import json
-import xlrd
-import codecs
+from collections import Counter
 import sys, getopt
+from functools import partial
+import pool
+from manifest import Manifest
+from output import open_output
+from sheet import load_sheets, row_id, SheetError
+from delta import snapshot_path, load_snapshot, save_snapshot, diff_rows
+from timings import Timings, run, sheet_rows
+from watch import watch
+from sheetcache import SheetCache
 
 
-def is_number(s):
-    try:
-        float(s)  # 如果能转换float，说明是个数字
-        return True
-    except ValueError:
-        pass  # 占位符
+VERSION = '3'
 
-    try:
-        import unicodedata  # 引入Unicodedata模块
-        unicodedata.numeric(s)  # 如果能转成numeric，说明是个数字
-        return True
-    except (TypeError, ValueError):
-        pass
 
-    return False
+def number_text(value):
+    """整数原样输出, 小数用能还原的最短表示"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
 
 
 def parseValue(value):
-    if is_number(value):
-        return ('%f' % value).rstrip('0').rstrip('.')
+    if isinstance(value, bool):
+        return 'true' if value else 'false'  # 表头声明为 bool 的列
+    elif not isinstance(value, str):
+        return number_text(value)  # 数字单元格读表时已经转好; 文本单元格即使像数字也按字符串导出, 与 xls2json 一致
     else:
         if len(value) > 1 and value[0] == '{' and value[-1] == '}':
             return value
         else:
             return '"%s"' % value
 
-def parseJson(root_dir='./xls', store_dir='"./json"'):
-    path = Path(root_dir)
+def internValues(rows):
+    """
+    --intern: rows 为 [[lua 值]], 出现不止一次的表字面量和比引用长的字符串放进常量池 K, 原地换成 K[n];
+    引用同一个值的行共用一个表(加载时只创建一次, 修改会影响所有行). 返回池的定义, 没有重复的值时返回 ''
+    """
+    counts = Counter(value for values in rows for value in values)
+    pool = {}
+    for values in rows:
+        for i, value in enumerate(values):
+            if counts[value] < 2 or value[0] not in '"{':
+                continue
+            n = pool.get(value)
+            if n is None:
+                n = len(pool) + 1
+                if value[0] == '"' and len(value) <= len('K[%d]' % n):
+                    continue  # 短字符串 lua 本来就只保存一份
+                pool[value] = n
+            values[i] = 'K[%d]' % n
+    if not pool:
+        return ''
+    return 'local K = {\n' + ''.join('    %s,\n' % value for value in pool) + '}\n'
+
+
+def writeSheet(sh, f, intern=False):
+    """把 sheet 页写成 lua 代码, f 是文本流"""
+    dic = []  # 配置行是拼好的 lua 代码, 数据行是 (id, [字段名], [lua 值]), 写出时再拼接
+    title = sh.title(1)
+    config = False
+    # 表头声明为 string 的列即使写的是数字也按字符串导出
+    strings = set(col for col, column in sh.columns.items() if column.type == 'string')
+    for rowvalue in sh.rows:
+        single = ''
+
+        id = row_id(rowvalue[0])
+        if id == 0:continue
+        if id is not None:
+            keys = []
+            values = []
+        else:
+            id = rowvalue[0]
+            if len(id.strip()) == 0:
+                continue
+            single += '%s.%s= %s' % (sh.name,id, parseValue(rowvalue[1]))
+            dic.append(single)
+            config = True
+            continue
+
+        for colnum in range(1, len(rowvalue)):
+            value = rowvalue[colnum]
+            if isinstance(value, str) and len(value.strip()) == 0:
+                continue
+            key = str(title[colnum])
+            # 忽略id列和空行
+            if key == 'id' or len(key.strip()) == 0:
+                continue
+            keys.append(key)
+            values.append('"%s"' % value if colnum in strings else parseValue(value))
+        dic.append((id, keys, values))
+    # --intern 要先看完所有行才知道哪些值重复
+    pool = internValues([row[2] for row in dic if isinstance(row, tuple)]) if intern and not config else ''
+    for i, row in enumerate(dic):
+        if isinstance(row, tuple):
+            id, keys, values = row
+            single = '["%s"] = {' % id + ''.join('%s = %s, ' % kv for kv in zip(keys, values))
+            dic[i] = single[:-2] + '}'
+    if config:
+        j = '%s= {}\n' % sh.name
+        j += '\n'.join(dic)
+        f.write(j)
+    else:
+        j = pool + "return\n{\n    "
+        j += ('\n    ,'.join(dic))
+        f.write(j + "\n}")
+
+
+# --lazy: 行存成按字段顺序的数组, 第一次访问某一行时才转成以字段名为 key 的表;
+# 下面的代码接在 fields 和 find/all 的定义后面: find(id) 返回存放这一行的表, all() 返回所有这样的表
+LAZY_ACCESSOR = '''
+local function materialize(row)
+    local r = {}
+    for i = 1, #fields do
+        r[fields[i]] = row[i]
+    end
+    return r
+end
+
+local meta = {}
+meta.__index = function(t, id)
+    local rows = find(id)
+    local row = rows and rows[id]
+    if row == nil then
+        return nil
+    end
+    rows[id] = nil -- 数组转换之后就不再需要
+    local r = materialize(row)
+    rawset(t, id, r)
+    return r
+end
+-- 遍历之前先转换所有行; lua 5.1 没有 __pairs, 可以先调用 getmetatable(t).__pairs(t)
+meta.__pairs = function(t)
+    for _, rows in ipairs(all()) do
+        for id in pairs(rows) do
+            local _ = t[id]
+        end
+    end
+    return next, t, nil
+end
+return setmetatable({}, meta)
+'''
+
+LAZY_ROWS = '''
+local function find(id)
+    return rows
+end
+
+local function all()
+    return {rows}
+end
+'''
+
+# 分块时每块是一个 <Sheet>Data_<n>.lua, 按 id 从小到大切分, 访问到时才用 require 加载
+LAZY_CHUNKS = '''local base = (...) or "%s"
+local bounds = {%s} -- 每块的第一个 id
+local chunks = {}
+
+local function chunk(i)
+    local rows = chunks[i]
+    if rows == nil then
+        rows = require(base .. "_" .. i)
+        chunks[i] = rows
+    end
+    return rows
+end
+
+local function find(id)
+    local n = tonumber(id)
+    if n == nil or n < bounds[1] then
+        return nil
+    end
+    local lo, hi = 1, #bounds
+    while lo < hi do
+        local mid = math.floor((lo + hi + 1) / 2)
+        if bounds[mid] <= n then
+            lo = mid
+        else
+            hi = mid - 1
+        end
+    end
+    return chunk(lo)
+end
+
+local function all()
+    local list = {}
+    for i = 1, #bounds do
+        list[i] = chunk(i)
+    end
+    return list
+end
+'''
 
-    all_json_file = list(path.glob('**/*.xlsm'))
-    for json_file in all_json_file:
-        if json_file.name.find("~$") != -1:  # 忽略文件打开时的临时文件
+
+def lazyRows(sh):
+    """返回 (字段名, [(id, 按字段顺序的 lua 值)]), 有配置行时返回 None"""
+    title = sh.title(1)
+    strings = set(col for col, column in sh.columns.items() if column.type == 'string')
+    # 忽略id列和空列
+    cols = [col for col in range(1, len(title)) if str(title[col]) != 'id' and len(str(title[col]).strip()) > 0]
+    rows = []
+    for rowvalue in sh.rows:
+        id = row_id(rowvalue[0])
+        if id == 0:
             continue
-        with xlrd.open_workbook(json_file) as wb:
-            dic = []
-            sh = wb.sheet_by_index(0)  # sheet页
-            title = sh.row_values(1)
-            if len(str(title[0]).strip()) == 0:
+        if id is None:
+            if len(rowvalue[0].strip()) == 0:
                 continue
+            return None
+        values = []
+        for col in cols:
+            value = rowvalue[col]
+            if isinstance(value, str) and len(value.strip()) == 0:
+                values.append('nil')
+            else:
+                values.append('"%s"' % value if col in strings else parseValue(value))
+        while values and values[-1] == 'nil':
+            values.pop()
+        rows.append((id, values))
+    return [str(title[col]) for col in cols], rows
+
+
+def rowsTable(rows):
+    return '{\n' + ''.join('    ["%s"] = {%s},\n' % (id, ', '.join(values)) for id, values in rows) + '}'
+
+
+def emitLazy(sh, store_dir, chunk=0, intern=False):
+    """--lazy 导出一个 sheet 页, chunk > 0 时每 chunk 行分成一个文件; --intern 时每个文件有自己的常量池"""
+    parsed = lazyRows(sh)
+    if parsed is None:
+        return emitSheet(sh, store_dir, intern=intern)  # 配置表仍按原来的格式导出
+    fields, rows = parsed
+    name = sh.name + 'Data'
+    output = store_dir + '/' + name + '.lua'
+    outputs = [output]
+    lines = ['-- %s: 由 xls2lua --lazy 生成, 用法与普通导出相同: t["id"].字段名' % name,
+             'local fields = {%s}' % ', '.join('"%s"' % key for key in fields)]
+    if chunk > 0 and len(rows) > chunk:
+        rows = sorted(rows, key=lambda row: row[0])
+        parts = [rows[i:i + chunk] for i in range(0, len(rows), chunk)]
+        for n, part in enumerate(parts, 1):
+            path = '%s/%s_%d.lua' % (store_dir, name, n)
+            outputs.append(path)
+            pool = internValues([values for id, values in part]) if intern else ''
+            with open_output(path) as f:
+                f.write(pool + 'return ' + rowsTable(part) + '\n')
+        lines.append(LAZY_CHUNKS % (name, ', '.join(str(part[0][0]) for part in parts)))
+    else:
+        pool = internValues([values for id, values in rows]) if intern else ''
+        if pool:
+            lines.append(pool.rstrip())
+        lines.append('local rows = ' + rowsTable(rows))
+        lines.append(LAZY_ROWS)
+    lines.append(LAZY_ACCESSOR)
+    with open_output(output) as f:
+        f.write('\n'.join(lines))
+    return outputs
 
-            config = False
-            for rownum in range(3, sh.nrows):
-                rowvalue = sh.row_values(rownum)
-                single = ''
-
-                id = rowvalue[0]
-                if id == 0:continue
-                if is_number(id):
-                    single += '["%s"] = {' % int(id)
-                else:
-                    if len(str(id).strip()) == 0:
-                        continue
-                    single += '%s.%s= %s' % (sh.name,id, parseValue(rowvalue[1]))
-                    dic.append(single)
-                    config = True
-                    continue
-
-                for colnum in range(1, len(rowvalue)):
-                    value = rowvalue[colnum]
-                    if len(str(value).strip()) == 0:
-                        continue
-                    key = str(title[colnum])
-                    # 忽略id列和空行
-                    if key == 'id' or len(key.strip()) == 0:
-                        continue
-                    single += '%s = %s, ' % (key, parseValue(value))
-                single = single[:-2]
-                single += '}'
-                dic.append(single)
-            # sheet页名+ Data.json 作为生成文件的名字
-            with codecs.open(store_dir + '/' + sh.name + 'Data.lua', "w", "utf-8") as f:
-                if config:
-                    j = '%s= {}\n' % sh.name
-                    j += '\n'.join(dic)
-                    f.write(j)
-                else:
-                    j = "return\n{\n    "
-                    j += ('\n    ,'.join(dic))
-                    f.write(j + "\n}")
+
+# --diff 生成的补丁是一个函数, 对已经加载的表调用: dofile("<Sheet>Data_patch.lua")(t); --lazy 的表也可以
+PATCH_APPLY = '''
+return function(t)
+    for _, id in ipairs(removed) do
+        local _ = t[id] -- --lazy 的表先转换这一行, 删掉之后不会再从数组里读出来
+        t[id] = nil
+    end
+    for id, row in pairs(added) do
+        t[id] = row
+    end
+    for id, fields in pairs(changed) do
+        local row = t[id]
+        for key, value in pairs(fields) do
+            row[key] = value
+        end
+        for _, key in ipairs(cleared[id] or {}) do
+            row[key] = nil
+        end
+    end
+    return t
+end
+'''
+
+
+def writePatch(sh, output):
+    """
+    --diff: 与上一次导出的快照比较, 写 <Sheet>Data_patch.lua, 返回生成的文件列表;
+    第一次导出(没有快照)和有配置行的表不生成补丁
+    """
+    parsed = lazyRows(sh)
+    if parsed is None:
+        return []
+    fields, values = parsed
+    rows = {str(id): {key: value for key, value in zip(fields, row) if value != 'nil'} for id, row in values}
+    path = snapshot_path(output)
+    old = load_snapshot(path)
+    outputs = [path]
+    if old is not None:
+        removed, added, changed, cleared = diff_rows(old, rows)
+        name = sh.name + 'Data'
+        lines = ['-- %s 相对上一次导出的变化, 由 xls2lua --diff 生成' % name,
+                 'local removed = {%s}' % ', '.join('"%s"' % id for id in removed)]
+        for local, entries in (('added', added), ('changed', changed)):
+            lines.append('local %s = {' % local)
+            lines += ['    ["%s"] = {%s},' % (id, ', '.join('%s = %s' % kv for kv in row.items())) for id, row in entries.items()]
+            lines.append('}')
+        lines.append('local cleared = {')
+        lines += ['    ["%s"] = {%s},' % (id, ', '.join('"%s"' % key for key in keys)) for id, keys in cleared.items()]
+        lines.append('}')
+        lines.append(PATCH_APPLY)
+        patch = output[:-len('.lua')] + '_patch.lua'
+        outputs.append(patch)
+        with open_output(patch) as f:
+            f.write('\n'.join(lines))
+    save_snapshot(path, rows)
+    return outputs
+
+
+def emitSheet(sh, store_dir, lazy=False, chunk=0, intern=False, diff=False):
+    """导出一个 sheet 页, 返回生成的文件列表"""
+    outputs = []
+    title = sh.title(1)
+    if len(title) == 0 or len(str(title[0]).strip()) == 0:
+        return outputs
+    # sheet页名+ Data.lua 作为生成文件的名字
+    output = store_dir + '/' + sh.name + 'Data.lua'
+    if lazy:
+        outputs = emitLazy(sh, store_dir, chunk, intern)
+    else:
+        outputs.append(output)
+        with open_output(output) as f:
+            writeSheet(sh, f, intern)
+    if diff:
+        outputs += writePatch(sh, output)
+    return outputs
+
+
+def exportWorkbook(json_file, store_dir, cache=None, sheets='', lazy=False, chunk=0, intern=False, diff=False):
+    # 一个工作簿里选中的所有 sheet 共用一次读取
+    return [output for sh in load_sheets(json_file, cache, sheets) for output in emitSheet(sh, store_dir, lazy, chunk, intern, diff)]
+
+
+def settings(sheets='', lazy=False, chunk=0, intern=False, diff=False):
+    """清单里记录的导出参数, xls2all 也用它"""
+    return VERSION + (' sheets=' + sheets if sheets else '') + (' lazy %d' % chunk if lazy else '') + (' intern' if intern else '') + \
+        (' diff' if diff else '')
+
+
+def parseJson(root_dir='./xls', store_dir='"./json"', incremental=False, jobs=1, cache=None, sheets='', lazy=False, chunk=0, intern=False, diff=False):
+    path = Path(root_dir)
+    # 增量模式下跳过没有变化的工作簿, 并删除源文件已不存在的产出
+    manifest = Manifest(root_dir, store_dir, 'xls2lua', settings(sheets, lazy, chunk, intern, diff)) if incremental else None
+
+    # 忽略文件打开时的临时文件
+    all_json_file = [f for f in path.glob('**/*.xlsm') if f.name.find("~$") == -1]
+    if manifest is not None:
+        manifest.prune(all_json_file)
+        all_json_file = [f for f in all_json_file if not manifest.is_fresh(f)]
+    all_outputs = pool.run(partial(exportWorkbook, store_dir=store_dir, cache=cache, sheets=sheets, lazy=lazy, chunk=chunk, intern=intern, diff=diff), all_json_file, jobs)
+    if manifest is not None:
+        for json_file, outputs in zip(all_json_file, all_outputs):
+            manifest.update(json_file, outputs)
+        manifest.save()
+
+
+def instrument(timings):
+    """--timings: 替换各阶段的函数来计时, 各阶段不含嵌套在其中的阶段"""
+    module = sys.modules[__name__]
+    timings.instrument(module, 'load_sheets', 'read', sheet_rows)
+    timings.instrument(module, 'parseValue', 'parseValue')
+    timings.instrument(module, 'emitSheet', 'emit')  # 拼接每行的 lua 文本并写文件
+    module.exportWorkbook = timings.wrap_file(module.exportWorkbook)
 
 
 def main(argv):
+    usage = ('xls2lua.py -i <inputfile> -o <outputfile> [--incremental] [--watch] [--sheets <prefixes>] [--lazy] [--chunk N] [--intern] [--diff] [--cache <dir>] [--cache-size MB] [--jobs N]'
+             ' [--timings] [--top N] [--profile <file>]')
     inputfile = ''
     outputfile = ''
+    incremental = False
+    watching = False
+    sheets = ''
+    lazy = False
+    chunk = 0
+    intern = False
+    diff = False
+    cache_dir = ''
+    cache_size = 512
+    jobs = 1
+    timings = None
+    profile = ''
+    top = 10
     try:
-        opts, args = getopt.getopt(argv, "hi:o:", ["ifile=", "ofile="])
+        opts, args = getopt.getopt(argv, "hi:o:", ["ifile=", "ofile=", "incremental", "watch", "sheets=", "lazy", "chunk=", "intern", "diff", "cache=", "cache-size=", "jobs=", "timings", "top=", "profile="])
     except getopt.GetoptError:
-        print('xls2lua.py -i <inputfile> -o <outputfile>')
+        print(usage)
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
-            print('xls2lua.py -i <inputfile> -o <outputfile>')
+            print(usage)
             sys.exit()
         elif opt in ("-i", "--ifile"):
             inputfile = arg
         elif opt in ("-o", "--ofile"):
             outputfile = arg
+        elif opt == "--incremental":
+            incremental = True
+        elif opt == "--watch":
+            watching = True
+        elif opt == "--sheets":
+            sheets = arg
+        elif opt == "--lazy":
+            lazy = True
+        elif opt == "--chunk":
+            lazy = True  # 分块只用于 --lazy 格式
+            chunk = int(arg)
+        elif opt == "--intern":
+            intern = True
+        elif opt == "--diff":
+            diff = True
+        elif opt == "--cache":
+            cache_dir = arg
+        elif opt == "--cache-size":
+            cache_size = int(arg)
+        elif opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--timings":
+            timings = Timings()
+        elif opt == "--top":
+            top = int(arg)
+        elif opt == "--profile":
+            profile = arg
+    if timings is not None:
+        instrument(timings)
+    if timings is not None or profile:
+        jobs = 1  # 计时和 cProfile 只能统计当前进程
 
     print('输入的文件为:', inputfile)
     print('输出的文件为:', outputfile)
-    parseJson(inputfile, outputfile)
+    # 解析结果的磁盘缓存, 内容没有变化的工作簿不再重新解析
+    cache = SheetCache(cache_dir, cache_size << 20) if cache_dir else None
+    if watching:
+        # 常驻进程总是增量导出, 每次保存只重新生成变化的工作簿
+        watch(lambda: parseJson(inputfile, outputfile, True, jobs, cache, sheets, lazy, chunk, intern, diff), inputfile)
+    else:
+        try:
+            run(parseJson, (inputfile, outputfile, incremental, jobs, cache, sheets, lazy, chunk, intern, diff), timings, profile, top)
+        except SheetError as e:
+            print(e)  # 表格内容有误, 已经列出出错的行和列
+            sys.exit(1)
     print('恭喜生成完成!!')
 
 
@@ -1,330 +1,505 @@
 from pathlib import Path
-import xlrd
 import sys, getopt
-import json
-import re
-import copy
-from typing import List
-import codecs
+from functools import partial
+import pool
+from manifest import Manifest
+from output import open_output
+from sheet import load_sheets, row_id, SheetError
+from timings import Timings, run, sheet_rows
+from watch import watch
+from sheetcache import SheetCache
+from schema import TypeInfo, build_struct, package_structs, render_structs, struct_to_dict, struct_from_dict
+from gocodec import create_codec_strings
+import xls2json
+from xls2bin import create_reader_strings
+from xls2json import parseRow
+
+VERSION = '7'
 
-StrList = List[str]
-DictList = List[dict]
-
-
-def get_unique_structs(struct_info: dict) -> DictList:
-    """
-    Returns a list containing the type mapping of all unique
-    structs (object types) in a struct datatype mapping.
-    """
-    unique_structs = []
-
-    if isinstance(struct_info, dict):
-        unique_structs.append(struct_info)
-
-    for k, v in struct_info.items():
-        if isinstance(v, dict):
-            unique_structs += get_unique_structs(v)
-
-    return unique_structs
-
-
-def generate_field_name(field_name: str) -> str:
-    """
-    Turns a snake_case field name into a PascalCase field name.
-    """
-    split_snake = field_name.split("_")
-    if len(split_snake) == 1:
-        struct_name = f"{field_name[0].upper()}{field_name[1:]}"
-    else:
-        split_snake = [s.capitalize() for s in split_snake]
-
-        struct_name = "".join(split_snake)
-
-    return struct_name
-
-
-def retype_nested_types(struct_info: dict) -> dict:
-    """
-    Recursively finds any nested object types in `struct_info` and
-    replaces the mapping info with the nested `__struct_name` field.
-    """
-    retyped_struct = copy.deepcopy(struct_info)
-
-    for k, v in struct_info.items():
-        if isinstance(v, dict):
-            if v["__is_type_array"]:
-                retyped_struct[k] = f"[]{v['__struct_name']}"
-            else:
-                retyped_struct[k] = v["__struct_name"]
-
-    return retyped_struct
-
-
-def create_struct_strings(struct_info: dict, omit_empty=True) -> StrList:
-    """
-    Turns struct info maps into multiline strings which can get
-    written to a .go file.
-
-    Eyyyy.
-    """
-    unique_structs = get_unique_structs(struct_info)
-
-    struct_strings = []
-
-    for i in range(len(unique_structs)):
-        unique_structs[i] = retype_nested_types(unique_structs[i])
-
-    for u in unique_structs:
-        struct_name = u.pop("__struct_name")
-        u.pop("__is_type_array")
-        struct_string = f"type {struct_name} struct " + "{\n"
-        for k, v in u.items():
-            field_name = generate_field_name(k)
-            if omit_empty:
-                struct_tag = f"`json:\"{k},omitempty\"`"
-            else:
-                struct_tag = f"`json:\"{k}\"`"
-            struct_string += f"\t{field_name}\t{v}\t{struct_tag}\n"
-        struct_string += "}"
-
-        struct_strings.append(struct_string)
-
-    return struct_strings
-
-
-def write_struct_file(struct_strings: StrList, package_name: str, output_filename: str):
-    with open(f"{output_filename}", "w") as structfile:
-        structfile.write(f"package {package_name}\n\n")
-        for s in struct_strings:
-            structfile.write(s + "\n\n")
 
+package_name = "xls"
 
-go_types_map = {
-    "str": "string",
-    "bool": "bool",
-    "int": "int",
-    "float": "float32",
-    # "list":"[]float32",
+# 可以建索引的字段类型
+INDEX_TYPES = ('int', 'float32', 'float64', 'string', 'bool')
+
+TABLE_IMPORTS = """import (
+\t"bytes"
+\t"encoding/json"
+\t"fmt"
+\t"os"
+\t"sort"
+\t"strconv"
+)
+
+// internedJSON 是 xls2json --intern 导出的文件里行以外的部分: 行里 refs 列出的列保存常量池 pool 的下标(从 1 开始)
+type internedJSON struct {
+\tPool []json.RawMessage `json:"pool"`
+\tRefs []string          `json:"refs"`
 }
 
-typename_re = re.compile("\<class\s\'(.+)\'\>")
-
-
-def get_items_by_type(json_data, datatype):
-    items = []
-
-    for k, v in json_data.items():
-        if isinstance(v, datatype):
-            items.append(k)
-
-    return items
-
-
-def get_type_name(type_):
-    return typename_re.search(str(type_)).groups(0)[0]
-
-
-def check_array_type(array):
-    """
-    Checks an array to ensure that all entries are of the same type.
-    Otherwise, shit'll get funky with struct building.
-    """
-    zero_index_type = type(array[0])
-    is_uniform_type = True
-
-    for a in array:
-        if not isinstance(a, zero_index_type):
-            is_uniform_type = False
-
-    zero_index_type = get_type_name(zero_index_type)
-
-    return (is_uniform_type, zero_index_type)
-
-
-def assure_uniform_object_structure(obj_array):
-    """
-    Checks if all dicts in a list of dicts have the same structure (keys and types)
-    """
-    all_same_keys = True
-    all_same_value_types = True
-
-    base_keys = list(obj_array[0].keys())
-    base_val_types = {k: type(v) for k, v in obj_array[0].items()}
-
-    if len(obj_array) == 1:
-        pass
-    else:
-        for obj in obj_array[1:]:
-            keys = list(obj.keys())
-            val_types = {k: type(v) for k, v in obj.items()}
-            all_same_keys = keys == base_keys
-            all_same_value_types = all([val_types[k] == base_val_types[k] for k in keys])
-
-    return (all_same_keys, all_same_value_types)
-
-
-def make_key_type_map(json_data):
-    key_type_map = {
-        k: type(v) for k, v in json_data.items()
-    }
-
-    return key_type_map
-
-
-def generate_struct_info(json_data, struct_name, is_array=False):
-    """
-    Not sure how I wrote this sober
-    """
-    struct_info = {
-        "__struct_name": struct_name,
-        "__is_type_array": is_array
-    }
-
-    key_type_map = make_key_type_map(json_data)
+// isInterned 判断是不是 --intern 格式, 普通格式第一层的 key 都是 id
+func isInterned(data []byte) bool {
+\treturn bytes.HasPrefix(bytes.TrimLeft(data, " \\t\\r\\n{"), []byte(`"pool"`))
+}
 
-    for k, v in key_type_map.items():
-        val_type_str = get_type_name(v)
+// isRef 判断 key 列保存的是不是常量池的下标
+func (doc *internedJSON) isRef(key string) bool {
+\tfor _, ref := range doc.Refs {
+\t\tif ref == key {
+\t\t\treturn true
+\t\t}
+\t}
+\treturn false
+}
 
-        json_item = json_data[k]
+// ref 把常量池里的第 i 个值解码到 v
+func (doc *internedJSON) ref(i int, v interface{}) error {
+\tif i < 1 || i > len(doc.Pool) {
+\t\treturn fmt.Errorf("常量池下标 %d 越界", i)
+\t}
+\treturn json.Unmarshal(doc.Pool[i-1], v)
+}
 
-        if val_type_str in go_types_map:
-            struct_info[k] = go_types_map[val_type_str]
-        elif val_type_str == "dict":
-            struct_info[k] = generate_struct_info(json_item, generate_field_name(k))
-        elif val_type_str == "list":
-            array_type_info = check_array_type(json_item)
+// tablePatch 是 xls2json --diff 导出的补丁(<Sheet>Data.json.patch), 对象的 key 由 encoding/json 直接转成整数
+type tablePatch struct {
+\tRemoved []string                           `json:"removed"`
+\tAdded   map[int]json.RawMessage            `json:"added"`
+\tChanged map[int]map[string]json.RawMessage `json:"changed"`
+\tCleared map[int][]string                   `json:"cleared"`
+}
 
-            if array_type_info[0]:
-                if array_type_info[1] == "dict":
-                    if all(assure_uniform_object_structure(json_item)):
-                        array_struct_name = f"{generate_field_name(k)}List"
-                        struct_info[k] = generate_struct_info(json_item[0], array_struct_name, is_array=True)
-                    else:
-                        struct_info[k] = "[]interface{}"
+// patchRow 把 old 编码成 json, 改写 changed 里的字段并删掉 cleared 里的字段, 再解码到 v
+func patchRow(old interface{}, changed map[string]json.RawMessage, cleared []string, v interface{}) error {
+\tdata, err := json.Marshal(old)
+\tif err != nil {
+\t\treturn err
+\t}
+\tvar fields map[string]json.RawMessage
+\tif err := json.Unmarshal(data, &fields); err != nil {
+\t\treturn err
+\t}
+\tfor key, value := range changed {
+\t\tfields[key] = value
+\t}
+\tfor _, key := range cleared {
+\t\tdelete(fields, key)
+\t}
+\tif data, err = json.Marshal(fields); err != nil {
+\t\treturn err
+\t}
+\treturn json.Unmarshal(data, v)
+}"""
+
+
+def pooled(field):
+    """xls2json --intern 把只有字符串、数组和对象的列放进常量池, interface{} 的列要看文件里的 refs"""
+    return field.type == 'string' or field.type.startswith('[]') or field.struct is not None
+
+
+def create_interned_decoder(root):
+    """生成 --intern 格式的解码函数: 先把行解到下标形式的结构体, 池里的值每列只解码一次, 引用同一个值的行共用它"""
+    name = root.name
+    shadow = name[0].lower() + name[1:] + 'Interned'
+    fields = [(f, 'int' if pooled(f) else f.type) for f in root.fields]
+    name_width = max([len(f.name) for f, _ in fields], default=0)
+    type_width = max([len(t) for _, t in fields], default=0)
+    lines = [f'// {shadow} 是 --intern 格式的一行, 常量池里的列保存下标',
+             f'type {shadow} struct ' + '{']
+    lines += [f'\t{f.name.ljust(name_width)} {t.ljust(type_width)} `json:"{f.key}"`' for f, t in fields]
+    lines += ['}', '',
+              f'func decode{name}Interned(data []byte) (map[string]*{name}, error) ' + '{',
+              '\tvar doc struct {',
+              '\t\tinternedJSON',
+              f'\t\tRows map[string]*{shadow} `json:"rows"`',
+              '\t}',
+              '\tif err := json.Unmarshal(data, &doc); err != nil {',
+              '\t\treturn nil, err',
+              '\t}',
+              '\trows := doc.Rows']
+    for f, t in fields:
+        if pooled(f):
+            lines.append(f'\tpool{f.name} := make(map[int]{f.type})')
+        elif f.type == 'interface{}':
+            lines += [f'\tref{f.name} := doc.isRef("{f.key}")',
+                      f'\tpool{f.name} := make(map[int]interface' + '{})']
+    lines += [f'\tresult := make(map[string]*{name}, len(rows))',
+              '\tfor id, r := range rows {',
+              f'\t\tv := &{name}' + '{}']
+    for f, t in fields:
+        if pooled(f):
+            lines += [f'\t\tif r.{f.name} > 0 ' + '{',
+                      f'\t\t\tx, ok := pool{f.name}[r.{f.name}]',
+                      '\t\t\tif !ok {',
+                      f'\t\t\t\tif err := doc.ref(r.{f.name}, &x); err != nil ' + '{',
+                      f'\t\t\t\t\treturn nil, fmt.Errorf("id %s 的 {f.key}: %w", id, err)',
+                      '\t\t\t\t}',
+                      f'\t\t\t\tpool{f.name}[r.{f.name}] = x',
+                      '\t\t\t}',
+                      f'\t\t\tv.{f.name} = x',
+                      '\t\t}']
+        elif f.type == 'interface{}':
+            # 解码成 interface{} 的数字是 float64
+            lines += [f'\t\tif i, ok := r.{f.name}.(float64); ok && ref{f.name} ' + '{',
+                      f'\t\t\tx, ok := pool{f.name}[int(i)]',
+                      '\t\t\tif !ok {',
+                      '\t\t\t\tif err := doc.ref(int(i), &x); err != nil {',
+                      f'\t\t\t\t\treturn nil, fmt.Errorf("id %s 的 {f.key}: %w", id, err)',
+                      '\t\t\t\t}',
+                      f'\t\t\t\tpool{f.name}[int(i)] = x',
+                      '\t\t\t}',
+                      f'\t\t\tv.{f.name} = x',
+                      '\t\t} else {',
+                      f'\t\t\tv.{f.name} = r.{f.name}',
+                      '\t\t}']
+        else:
+            lines.append(f'\t\tv.{f.name} = r.{f.name}')
+    lines += ['\t\tresult[id] = v',
+              '\t}',
+              '\treturn result, nil',
+              '}']
+    return '\n'.join(lines)
+
+
+def create_table_strings(roots):
+    """为每个数据表生成按 id 查找的容器, 以及表头上声明了 index/unique 的列的索引"""
+    strings = []
+    for root in roots:
+        if root.indexes is None:
+            continue  # key/value 形式的配置表没有 id
+        fields = {f.key: f for f in root.fields}
+        # 只给基本类型的列建索引, 没有出现过值的列没有对应字段
+        indexes = [(fields[key], unique) for key, unique in root.indexes
+                   if key in fields and fields[key].type in INDEX_TYPES]
+        name = root.name
+        table = name + 'Table'
+        members = [('ids', '[]int', ''), ('dense', f'[]*{name}', ' // id 连续时按 id-base 存放'),
+                   ('base', 'int', ''), ('rows', f'map[int]*{name}', ' // id 稀疏时使用')]
+        members += [(f'by{field.name}', f'map[{field.type}]' + (f'*{name}' if unique else f'[]*{name}'), '')
+                    for field, unique in indexes]
+        width = max(len(m[0]) for m in members)  # 与 gofmt 一样对齐字段类型
+        lines = [f'// {table} 按 id 和索引列查找 {name}, 由 New{table} 一次建好, 之后只读',
+                 f'type {table} struct ' + '{']
+        lines += [f'\t{member.ljust(width)} {type_}{comment}' for member, type_, comment in members]
+        lines += ['}', '',
+                  f'// New{table} 由 json 解出的 map 建表, id 不是整数或 unique 列有重复值时返回错误',
+                  f'func New{table}(rows map[string]*{name}) (*{table}, error) ' + '{',
+                  f'\tbyID := make(map[int]*{name}, len(rows))',
+                  '\tfor key, v := range rows {',
+                  '\t\tid, err := strconv.Atoi(key)',
+                  '\t\tif err != nil {',
+                  f'\t\t\treturn nil, fmt.Errorf("{name}: id %q 不是整数", key)',
+                  '\t\t}',
+                  '\t\tif _, ok := byID[id]; ok {',
+                  f'\t\t\treturn nil, fmt.Errorf("{name}: id %d 重复", id)',
+                  '\t\t}',
+                  '\t\tbyID[id] = v',
+                  '\t}',
+                  f'\treturn new{table}(byID)',
+                  '}', '',
+                  f'func new{table}(byID map[int]*{name}) (*{table}, error) ' + '{',
+                  f'\tt := &{table}' + '{ids: make([]int, 0, len(byID))}',
+                  '\tfor id := range byID {',
+                  '\t\tt.ids = append(t.ids, id)',
+                  '\t}',
+                  '\tsort.Ints(t.ids)',
+                  '\tif n := len(t.ids); n > 0 && t.ids[n-1]-t.ids[0] < 2*n {',
+                  '\t\tt.base = t.ids[0]',
+                  f'\t\tt.dense = make([]*{name}, t.ids[n-1]-t.base+1)',
+                  '\t\tfor id, v := range byID {',
+                  '\t\t\tt.dense[id-t.base] = v',
+                  '\t\t}',
+                  '\t} else {',
+                  '\t\tt.rows = byID',
+                  '\t}']
+        if indexes:
+            for field, unique in indexes:
+                value = f'*{name}' if unique else f'[]*{name}'
+                lines.append(f'\tt.by{field.name} = make(map[{field.type}]{value})')
+            # 按 id 顺序建索引, 同一个值对应的多行也按 id 排列
+            lines += ['\tfor _, id := range t.ids {',
+                      '\t\tv := byID[id]',
+                      '\t\tif v == nil {',
+                      '\t\t\tcontinue',
+                      '\t\t}']
+            for field, unique in indexes:
+                index = f't.by{field.name}'
+                if unique:
+                    lines += [f'\t\tif _, ok := {index}[v.{field.name}]; ok ' + '{',
+                              f'\t\t\treturn nil, fmt.Errorf("{name}: id %d 的 {field.key} %v 与其他行重复", id, v.{field.name})',
+                              '\t\t}',
+                              f'\t\t{index}[v.{field.name}] = v']
                 else:
-                    zero_index_type = get_type_name(type(json_item[0]))
-                    if zero_index_type == 'list':
-                        zero_index_type = get_type_name(type(json_item[0][0]))
-                        # print(zero_index_type,"zero_index_type")
-                        zero_index_type = go_types_map[zero_index_type]
-                        struct_info[k] = f"[][]{zero_index_type}"
-                    else:
-                        zero_index_type = go_types_map[zero_index_type]
-                        struct_info[k] = f"[]{zero_index_type}"
+                    lines.append(f'\t\t{index}[v.{field.name}] = append({index}[v.{field.name}], v)')
+            lines.append('\t}')
+        lines += ['\treturn t, nil', '}', '',
+                  f'// Load{table} 读取 xls2json 导出的 json 文件并建表, 普通格式和 --intern 格式都可以',
+                  f'func Load{table}(path string) (*{table}, error) ' + '{',
+                  '\tdata, err := os.ReadFile(path)',
+                  '\tif err != nil {',
+                  '\t\treturn nil, err',
+                  '\t}',
+                  f'\tvar rows map[string]*{name}',
+                  '\tif isInterned(data) {',
+                  f'\t\trows, err = decode{name}Interned(data)',
+                  '\t} else {',
+                  '\t\terr = json.Unmarshal(data, &rows)',
+                  '\t}',
+                  '\tif err != nil {',
+                  '\t\treturn nil, fmt.Errorf("%s: %w", path, err)',
+                  '\t}',
+                  f'\treturn New{table}(rows)',
+                  '}', '',
+                  '// Get 按 id 查找, 不存在时返回 nil',
+                  f'func (t *{table}) Get(id int) *{name} ' + '{',
+                  '\tif t.rows != nil {',
+                  '\t\treturn t.rows[id]',
+                  '\t}',
+                  '\tif i := id - t.base; i >= 0 && i < len(t.dense) {',
+                  '\t\treturn t.dense[i]',
+                  '\t}',
+                  '\treturn nil',
+                  '}', '',
+                  '// Len 返回行数',
+                  f'func (t *{table}) Len() int ' + '{',
+                  '\treturn len(t.ids)',
+                  '}', '',
+                  '// IDs 返回从小到大排列的全部 id, 调用方不能修改',
+                  f'func (t *{table}) IDs() []int ' + '{',
+                  '\treturn t.ids',
+                  '}', '',
+                  '// ApplyPatch 读取 xls2json --diff 导出的补丁, 返回打过补丁的新表;',
+                  '// t 不变, 没有变化的行由两张表共用, 正在使用 t 的代码不受影响, 换成新表即可',
+                  f'func (t *{table}) ApplyPatch(path string) (*{table}, error) ' + '{',
+                  '\tdata, err := os.ReadFile(path)',
+                  '\tif err != nil {',
+                  '\t\treturn nil, err',
+                  '\t}',
+                  '\tvar patch tablePatch',
+                  '\tif err := json.Unmarshal(data, &patch); err != nil {',
+                  '\t\treturn nil, fmt.Errorf("%s: %w", path, err)',
+                  '\t}',
+                  f'\tbyID := make(map[int]*{name}, len(t.ids)+len(patch.Added))',
+                  '\tfor _, id := range t.ids {',
+                  '\t\tbyID[id] = t.Get(id)',
+                  '\t}',
+                  '\tfor _, key := range patch.Removed {',
+                  '\t\tid, err := strconv.Atoi(key)',
+                  '\t\tif err != nil {',
+                  '\t\t\treturn nil, fmt.Errorf("%s: id %q 不是整数", path, key)',
+                  '\t\t}',
+                  '\t\tdelete(byID, id)',
+                  '\t}',
+                  '\tfor id, raw := range patch.Added {',
+                  f'\t\tv := &{name}' + '{}',
+                  '\t\tif err := json.Unmarshal(raw, v); err != nil {',
+                  '\t\t\treturn nil, fmt.Errorf("%s: id %d: %w", path, id, err)',
+                  '\t\t}',
+                  '\t\tbyID[id] = v',
+                  '\t}',
+                  '\tfor id, fields := range patch.Changed {',
+                  '\t\told := byID[id]',
+                  '\t\tif old == nil {',
+                  '\t\t\treturn nil, fmt.Errorf("%s: id %d 不在表里, 补丁与表的版本不一致", path, id)',
+                  '\t\t}',
+                  f'\t\tv := &{name}' + '{}',
+                  '\t\tif err := patchRow(old, fields, patch.Cleared[id], v); err != nil {',
+                  '\t\t\treturn nil, fmt.Errorf("%s: id %d: %w", path, id, err)',
+                  '\t\t}',
+                  '\t\tbyID[id] = v',
+                  '\t}',
+                  f'\treturn new{table}(byID)',
+                  '}']
+        for field, unique in indexes:
+            if unique:
+                lines += ['', f'// FindBy{field.name} 按 {field.key} 查找, 不存在时返回 nil',
+                          f'func (t *{table}) FindBy{field.name}(v {field.type}) *{name} ' + '{']
             else:
-                struct_info[k] = "[]interface{}"
-
-    return struct_info
-
-
-def is_number(s):
-    try:
-        float(s)  # 如果能转换float，说明是个数字
-        return True
-    except ValueError:
-        pass  # 占位符
-
-    try:
-        import unicodedata  # 引入Unicodedata模块
-        unicodedata.numeric(s)  # 如果能转成numeric，说明是个数字
-        return True
-    except (TypeError, ValueError):
-        pass
-
-    return False
-
-
-def parseValue(value):
-    if is_number(value):
-        return ('%f' % value).rstrip('0').rstrip('.')
-    else:
-        if len(value) > 1 and value[0] == '[' and value[-1] == ']':
-            return value.replace('=', ':', -1)
-        elif len(value) > 1 and value[0] == '{' and value[-1] == '}':
-            return value.replace('{', '[', -1).replace('}', ']', -1)
-        else:
-            return '"%s"' % value
-
-package_name = "xls"
-def write(store_dir):
-    with codecs.open(store_dir + '/' + 'xls.go', "w", "utf-8") as f:
+                lines += ['', f'// FindBy{field.name} 返回 {field.key} 等于 v 的所有行, 按 id 排列',
+                          f'func (t *{table}) FindBy{field.name}(v {field.type}) []*{name} ' + '{']
+            lines += [f'\treturn t.by{field.name}[v]', '}']
+        strings.append('\n'.join(lines))
+        strings.append(create_interned_decoder(root))
+    if strings:
+        strings.insert(0, TABLE_IMPORTS)
+    return strings
+
+
+def writeStructs(store_dir, roots, bin=False, codec=False, tables=False):
+    roots = [r for r in roots if r is not None]
+    structs = package_structs(roots)
+    # 整个文件在内存里拼好再写, 内容没变时不改动文件
+    with open_output(store_dir + '/' + 'xls.go') as f:
         f.write(f"package {package_name}\n\n")
-
-def parseJson(root_dir='./xls', store_dir='"./go"'):
+        # 所有 sheet 共用一个类型表, 相同结构只生成一次
+        for s in render_structs(structs, False):
+            f.write(s + "\n\n")
+    if codec:
+        # 不经过反射的 UnmarshalJSON/MarshalJSON
+        with open_output(store_dir + '/' + 'xls_codec.go') as f:
+            f.write(f"package {package_name}\n\n")
+            for s in create_codec_strings(structs, roots):
+                f.write(s + "\n\n")
+    if tables:
+        # 按 id 和索引列查找的容器
+        with open_output(store_dir + '/' + 'xls_tables.go') as f:
+            f.write(f"package {package_name}\n\n")
+            for s in create_table_strings(roots):
+                f.write(s + "\n\n")
+    if bin:
+        # xls2bin 导出的二进制表的读取代码, 结构体名已经在上面确定
+        with open_output(store_dir + '/' + 'xlsbin.go') as f:
+            f.write(f"package {package_name}\n\n")
+            for s in create_reader_strings(roots):
+                f.write(s + "\n\n")
+
+def emitSheet(sh):
+    """解析一个 sheet 页, 返回顶层结构体, 没有表头时返回 None"""
+    title = sh.title(2)
+    if len(title) == 0 or len(str(title[0]).strip()) == 0:
+        return None
+
+    # 所有数据行的类型合并到一起; 没有数据行时是 key/value 形式的配置表
+    rows = TypeInfo()
+    config = {}
+    for rowvalue in sh.rows:
+        entry = parseRow(title, rowvalue)
+        if entry is None:
+            continue
+        if row_id(rowvalue[0]) is not None:
+            rows.add(entry[1])
+        else:
+            config[entry[0]] = entry[1]
+    if not rows.kinds:
+        return build_struct(TypeInfo().add_all([config]), sh.name + 'Data')
+    root = build_struct(rows, sh.name + 'Data')
+    # 表头上声明了 index/unique 的列, 由 --tables 生成索引
+    root.indexes = [[str(title[col]), column.index == 'unique']
+                    for col, column in sorted(sh.columns.items()) if column.index and col != 0]
+    return root
+
+def exportWorkbook(json_file, cache=None, sheets=''):
+    """返回工作簿里选中的各个 sheet 的顶层结构体, 跳过没有表头的 sheet"""
+    roots = [emitSheet(sh) for sh in load_sheets(json_file, cache, sheets)]
+    return [root for root in roots if root is not None]
+
+def parseJson(root_dir='./xls', store_dir='"./go"', incremental=False, jobs=1, bin=False, codec=False, tables=False, cache=None,
+              sheets=''):
     path = Path(root_dir)
-    write(store_dir)
-    with codecs.open(store_dir + '/' + 'xls.go', "a", "utf-8") as f:
-        all_json_file = list(path.glob('**/*.xlsm'))
+    outputs = [store_dir + '/' + 'xls.go'] + ([store_dir + '/' + 'xlsbin.go'] if bin else []) + \
+              ([store_dir + '/' + 'xls_codec.go'] if codec else []) + \
+              ([store_dir + '/' + 'xls_tables.go'] if tables else [])
+    # 增量模式下没有变化的工作簿直接复用上次生成的结构体
+    settings = VERSION + (' bin' if bin else '') + (' codec' if codec else '') + (' tables' if tables else '') + \
+               (' sheets=' + sheets if sheets else '')
+    manifest = Manifest(root_dir, store_dir, 'xls2struct', settings) if incremental else None
+
+    # 忽略文件打开时的临时文件, 排序保证生成的类型名与顺序不随文件系统变化
+    all_json_file = sorted(f for f in path.glob('**/*.xlsm') if f.name.find("~$") == -1)
+    dirty = manifest is None
+    roots = {}
+    if manifest is not None:
+        dirty = len(manifest.prune(all_json_file)) > 0
         for json_file in all_json_file:
-            if json_file.name.find("~$") != -1:  # 忽略文件打开时的临时文件
-                continue
-            with xlrd.open_workbook(json_file) as wb:
-                dic = []
-                sh = wb.sheet_by_index(0)  # sheet页
-                title = sh.row_values(2)
-                if len(str(title[0]).strip()) == 0:
-                    continue
-
-                single = '{'
-                for rownum in range(3, sh.nrows):
-                    rowvalue = sh.row_values(rownum)
-                    id = rowvalue[0]
-                    if is_number(id):
-                        for colnum in range(1, len(rowvalue)):
-                            value = rowvalue[colnum]
-                            if len(str(value).strip()) == 0:
-                                continue
-                            key = str(title[colnum])
-                            # 忽略id列和空行
-                            if key == 'id' or len(key.strip()) == 0:
-                                continue
-                            single += '"%s" : %s, ' % (key, parseValue(value))
-                        single = single[:-2]
-                        single += '}'
-
-                        json_data = json.loads(single)
-                        struct_info = generate_struct_info(json_data, sh.name + 'Data', True)
-                        struct_strings = create_struct_strings(struct_info, False)
-                        for s in struct_strings:
-                            f.write(s + "\n\n")
-                        break
-                    else:
-                        if len(str(id).strip()) == 0:
-                            continue
-                        single += '"%s" : %s,' % (id, parseValue(rowvalue[1]))
-                        # dic.append(single)
-                        # print(single, "----")
-                        # continue
-                else:
-                    single=single[:-1]
-                    single += "}"
-                    json_data = json.loads(single)
-                    struct_info = generate_struct_info(json_data, sh.name + 'Data', True)
-                    struct_strings = create_struct_strings(struct_info, False)
-                    for s in struct_strings:
-                        f.write(s + "\n\n")
+            if manifest.is_fresh(json_file):
+                roots[json_file] = [struct_from_dict(s) for s in manifest.get(json_file, 'structs', [])]
+    todo = [f for f in all_json_file if f not in roots]
+    for json_file, file_roots in zip(todo, pool.run(partial(exportWorkbook, cache=cache, sheets=sheets), todo, jobs)):
+        roots[json_file] = file_roots
+        dirty = True
+        if manifest is not None:
+            manifest.update(json_file, outputs, structs=[struct_to_dict(root) for root in file_roots])
+
+    if dirty:
+        # 按文件顺序生成, 与各进程完成的先后无关
+        writeStructs(store_dir, [root for f in all_json_file for root in roots[f]], bin, codec, tables)
+    if manifest is not None:
+        manifest.save()
+
+
+def instrument(timings):
+    """--timings: 替换各阶段的函数来计时, 各阶段不含嵌套在其中的阶段"""
+    module = sys.modules[__name__]
+    timings.instrument(module, 'load_sheets', 'read', sheet_rows)
+    timings.instrument(module, 'parseRow', 'parse')
+    timings.instrument(xls2json, 'parseValue', 'parseValue')
+    timings.instrument(module, 'emitSheet', 'infer')
+    timings.instrument(module, 'build_struct', 'build')
+    timings.instrument(module, 'writeStructs', 'write')
+    module.exportWorkbook = timings.wrap_file(module.exportWorkbook)
 
 
 def main(argv):
+    usage = ('xls2struct.py -i <inputfile> -o <outputfile> [--incremental] [--watch] [--sheets <prefixes>] [--cache <dir>] [--cache-size MB] [--jobs N]'
+             ' [--bin] [--codec] [--tables] [--timings] [--top N] [--profile <file>]')
     inputfile = ''
     outputfile = ''
+    incremental = False
+    watching = False
+    sheets = ''
+    cache_dir = ''
+    cache_size = 512
+    jobs = 1
+    bin = False
+    codec = False
+    tables = False
+    timings = None
+    profile = ''
+    top = 10
     try:
-        opts, args = getopt.getopt(argv, "hi:o:", ["ifile=", "ofile="])
+        opts, args = getopt.getopt(argv, "hi:o:", ["ifile=", "ofile=", "incremental", "watch", "sheets=", "cache=", "cache-size=", "jobs=", "bin", "codec", "tables", "timings", "top=", "profile="])
     except getopt.GetoptError:
-        print('xls2struct.py -i <inputfile> -o <outputfile>')
+        print(usage)
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
-            print('xls2struct.py -i <inputfile> -o <outputfile>')
+            print(usage)
             sys.exit()
         elif opt in ("-i", "--ifile"):
             inputfile = arg
         elif opt in ("-o", "--ofile"):
             outputfile = arg
+        elif opt == "--incremental":
+            incremental = True
+        elif opt == "--watch":
+            watching = True
+        elif opt == "--sheets":
+            sheets = arg
+        elif opt == "--cache":
+            cache_dir = arg
+        elif opt == "--cache-size":
+            cache_size = int(arg)
+        elif opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--bin":
+            bin = True
+        elif opt == "--codec":
+            codec = True
+        elif opt == "--tables":
+            tables = True
+        elif opt == "--timings":
+            timings = Timings()
+        elif opt == "--top":
+            top = int(arg)
+        elif opt == "--profile":
+            profile = arg
+    if timings is not None:
+        instrument(timings)
+    if timings is not None or profile:
+        jobs = 1  # 计时和 cProfile 只能统计当前进程
 
     print('输入的文件为:', inputfile)
     print('输出的文件为:', outputfile)
-    parseJson(inputfile, outputfile)
+    # 解析结果的磁盘缓存, 内容没有变化的工作簿不再重新解析
+    cache = SheetCache(cache_dir, cache_size << 20) if cache_dir else None
+    if watching:
+        # 常驻进程总是增量导出, 每次保存只重新生成变化的工作簿
+        watch(lambda: parseJson(inputfile, outputfile, True, jobs, bin, codec, tables, cache, sheets), inputfile)
+    else:
+        try:
+            run(parseJson, (inputfile, outputfile, incremental, jobs, bin, codec, tables, cache, sheets), timings, profile, top)
+        except SheetError as e:
+            print(e)  # 表格内容有误, 已经列出出错的行和列
+            sys.exit(1)
     print('恭喜生成完成!!')
 
 
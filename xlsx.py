@@ -0,0 +1,231 @@
+import posixpath
+import zipfile
+from xml.parsers import expat
+import xml.etree.ElementTree as ET
+
+# 直接从 xlsx/xlsm 压缩包里流式读取 sheet 的行, 不把整个工作簿加载到内存
+# 单元格类型与 xlrd 保持一致, 导出代码不需要区分两种读取方式
+
+XL_CELL_EMPTY = 0
+XL_CELL_TEXT = 1
+XL_CELL_NUMBER = 2
+XL_CELL_DATE = 3
+XL_CELL_BOOLEAN = 4
+XL_CELL_ERROR = 5
+XL_CELL_BLANK = 6
+
+# 与 xlrd.error_text_from_code 相反的映射
+ERROR_CODES = {
+    '#NULL!': 0x00,
+    '#DIV/0!': 0x07,
+    '#VALUE!': 0x0F,
+    '#REF!': 0x17,
+    '#NAME?': 0x1D,
+    '#NUM!': 0x24,
+    '#N/A': 0x2A,
+}
+
+
+def _ns(tag):
+    return tag[:tag.index('}') + 1] if tag.startswith('{') else ''
+
+
+def _rel_id(elem):
+    for k, v in elem.attrib.items():
+        if k.endswith('}id'):
+            return v
+    return None
+
+
+def col_index(ref):
+    """'AB12' -> 27"""
+    n = 0
+    for ch in ref:
+        if ch >= 'A':
+            n = n * 26 + ord(ch) - 64
+        else:
+            break
+    return n - 1
+
+
+class SheetReader:
+    def __init__(self, book, name, path):
+        self.book = book
+        self.name = name
+        self.path = path
+
+    def iter_rows(self, chunk_size=1 << 16):
+        """按顺序返回 (values, types), 缺失的行和单元格补成空值, 与 xlrd.row_values 一致"""
+        # 用 expat 回调逐块解析, 不构建元素树, 内存占用与表的大小无关
+        book = self.book
+        done = []  # 已经解析完、等待返回的行
+        local_names = {}
+        ncols = 0
+        nrow = 0
+        values = types = None
+        col = 0
+        cell_type = 'n'
+        text = None
+        in_text = False
+
+        def local(name):
+            n = local_names[name] = name.rpartition(':')[2]
+            return n
+
+        def start(name, attrs):
+            nonlocal ncols, nrow, values, types, col, cell_type, text, in_text
+            n = local_names.get(name) or local(name)
+            if n == 'c':
+                ref = attrs.get('r')
+                if ref:
+                    col = col_index(ref)
+                cell_type = attrs.get('t', 'n')
+                text = None
+            elif n == 'v' or n == 't':
+                if text is None:
+                    text = []
+                in_text = True
+            elif n == 'row':
+                r = attrs.get('r')
+                r = int(r) - 1 if r else nrow
+                while nrow < r:
+                    done.append(([''] * ncols, [XL_CELL_EMPTY] * ncols))
+                    nrow += 1
+                values = [''] * ncols
+                types = [XL_CELL_EMPTY] * ncols
+                col = 0
+            elif n == 'dimension':
+                ref = attrs.get('ref', '').split(':')[-1]
+                if ref:
+                    ncols = col_index(ref) + 1
+
+        def end(name):
+            nonlocal nrow, col, in_text
+            n = local_names.get(name) or local(name)
+            if n == 'c':
+                while col >= len(values):
+                    values.append('')
+                    types.append(XL_CELL_EMPTY)
+                value, ctype = cell_value(book, cell_type, text)
+                values[col] = value
+                types[col] = ctype
+                col += 1
+            elif n == 'v' or n == 't':
+                in_text = False
+            elif n == 'row':
+                done.append((values, types))
+                nrow += 1
+
+        def data(s):
+            if in_text:
+                text.append(s)
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = data
+        with book.zf.open(self.path) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                parser.Parse(chunk, not chunk)
+                yield from done
+                done.clear()
+                if not chunk:
+                    break
+
+
+def cell_value(book, t, text):
+    if text is None:
+        return '', XL_CELL_EMPTY  # 与 xlrd 默认(不读格式)一致
+    text = ''.join(text)
+    if not text:
+        return '', XL_CELL_EMPTY  # 没有缓存值的公式(<v/>)等, xlrd 同样按空单元格处理
+    if t == 'n':
+        return float(text), XL_CELL_NUMBER
+    if t == 's':
+        return book.shared_strings[int(text)], XL_CELL_TEXT
+    if t == 'str' or t == 'inlineStr':
+        return text, XL_CELL_TEXT
+    if t == 'b':
+        return int(text), XL_CELL_BOOLEAN
+    if t == 'e':
+        return ERROR_CODES.get(text, 0x2A), XL_CELL_ERROR
+    return text, XL_CELL_TEXT  # 'd' ISO 日期, 按文本导出
+
+
+class Workbook:
+    def __init__(self, filename):
+        self.zf = zipfile.ZipFile(filename)
+        self._shared_strings = None
+        self.sheets = self._load_sheets()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.zf.close()
+
+    def _load_sheets(self):
+        rels = {}
+        root = ET.fromstring(self.zf.read('xl/_rels/workbook.xml.rels'))
+        for rel in root:
+            target = rel.get('Target')
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join('xl', target))
+            rels[rel.get('Id')] = target
+        root = ET.fromstring(self.zf.read('xl/workbook.xml'))
+        ns = _ns(root.tag)
+        return [(sheet.get('name'), rels[_rel_id(sheet)]) for sheet in root.iter(ns + 'sheet')]
+
+    @property
+    def shared_strings(self):
+        # 第一次遇到共享字符串时才解析 sharedStrings.xml
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if 'xl/sharedStrings.xml' in self.zf.namelist():
+                with self.zf.open('xl/sharedStrings.xml') as f:
+                    self._shared_strings = self._parse_shared_strings(f)
+        return self._shared_strings
+
+    @staticmethod
+    def _parse_shared_strings(f):
+        strings = []
+        ns = None
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if ns is None:
+                ns = _ns(elem.tag)
+                SI = ns + 'si'
+                T = ns + 't'
+                RPH = ns + 'rPh'
+                root = elem
+            if event == 'end' and elem.tag == SI:
+                # 富文本由多个 <r><t> 组成, 注音 <rPh> 不算正文
+                parts = []
+                for child in elem:
+                    if child.tag == T:
+                        parts.append(child.text or '')
+                    elif child.tag != RPH:
+                        parts.extend(t.text or '' for t in child.iter(T))
+                strings.append(''.join(parts))
+                root.remove(elem)
+        return strings
+
+    def nsheets(self):
+        return len(self.sheets)
+
+    def sheet_names(self):
+        return [name for name, path in self.sheets]
+
+    def sheet_by_index(self, index):
+        name, path = self.sheets[index]
+        return SheetReader(self, name, path)
+
+
+def open_workbook(filename):
+    return Workbook(filename)